@@ -0,0 +1,155 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Peak memory of a crawl, on the same path as the endpoint.
+
+The stars are synthetic, but go through `CachedGitHubRepository` and the
+process-wide starred repos cache like requests do, so the cache counts in the
+peak. The neighbours are then serialized like the endpoint does, into memory
+or, past the budget, a temporary file. Set `STARNEIGHBOURS_MEMORY_BUDGET` to
+compare, e.g.:
+
+    uv run python benchmarks/crawl_memory.py --stargazers 20000
+    STARNEIGHBOURS_MEMORY_BUDGET=67108864 uv run python benchmarks/crawl_memory.py --stargazers 20000
+    STARNEIGHBOURS_MEMORY_BUDGET=67108864 uv run python benchmarks/crawl_memory.py --stargazers 20000 --top 100
+
+Peak RSS is read from the kernel, so run one measure per process.
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from starneighbours.models.cache import neighbours_write
+from starneighbours.models.github import (
+    GitHubRepo,
+    GitHubRepository,
+    GitHubUser,
+    StarNeighbour,
+)
+from starneighbours.repositories.api import (
+    starneighbour_service_create,
+    starred_repos_cache_create,
+)
+from starneighbours.repositories.cached_github import CachedGitHubRepository
+
+
+class SyntheticGitHubRepository(GitHubRepository):
+    """Stargazers that each starred `starred` repos, popular ones more often.
+
+    Repos are built anew on each call, like when parsed from the GitHub API.
+    """
+
+    def __init__(self, stargazers: int, starred: int, repos: int, seed: int) -> None:
+        self.stargazers = stargazers
+        self.starred = starred
+        self.repos = repos
+        self.seed = seed
+
+    async def get_stargazers(
+        self,
+        user: str,
+        repo: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[GitHubUser]:
+        return [GitHubUser(login=f"stargazer{i}") for i in range(self.stargazers)]
+
+    async def get_starred_repos(self, user: str) -> list[GitHubRepo]:
+        rnd = random.Random(f"{self.seed}-{user}")
+        indices = {
+            min(int(rnd.paretovariate(1.0)) - 1, self.repos - 1)
+            if rnd.random() < 0.5
+            else rnd.randrange(self.repos)
+            for _ in range(self.starred)
+        }
+        return [self._repo(i) for i in indices]
+
+    async def get_starred_repos_count(self, user: str) -> int:
+        return self.starred
+
+    @staticmethod
+    def _repo(index: int) -> GitHubRepo:
+        full_name = f"owner{index % 10_000}/repository-{index}"
+        return GitHubRepo(
+            name=f"repository-{index}",
+            full_name=full_name,
+            description=f"Description of the repository number {index}",
+            html_url=f"https://github.com/{full_name}",
+            stargazers_count=index % 100_000,
+        )
+
+
+class _Counted:
+    """Count the neighbours while they are serialized."""
+
+    def __init__(self, neighbours: Iterable[StarNeighbour]) -> None:
+        self.neighbours = neighbours
+        self.count = 0
+
+    def __iter__(self) -> Iterator[StarNeighbour]:
+        for neighbour in self.neighbours:
+            self.count += 1
+            yield neighbour
+
+
+def _rss() -> int:
+    # In KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stargazers", type=int, default=10_000)
+    parser.add_argument("--starred", type=int, default=100)
+    parser.add_argument("--repos", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, help="only the top neighbours")
+    args = parser.parse_args()
+
+    cache = starred_repos_cache_create()
+    github_repo = CachedGitHubRepository(
+        SyntheticGitHubRepository(args.stargazers, args.starred, args.repos, args.seed),
+        cache,
+    )
+    service = starneighbour_service_create(github_repo)
+    before = _rss()
+
+    start = time.perf_counter()
+    neighbours: Iterable[StarNeighbour]
+    if args.top is None:
+        neighbours = await service.iter_neighbours("owner", "target")
+    else:
+        neighbours = await service.find_top_neighbours("owner", "target", args.top)
+    counted = _Counted(neighbours)
+    with (
+        io.BytesIO()
+        if service.memory_budget is None
+        else tempfile.SpooledTemporaryFile(max_size=service.memory_budget)
+    ) as body:
+        neighbours_write(counted, body)
+        size = body.tell()
+    elapsed = time.perf_counter() - start
+
+    sys.stdout.write(
+        f"stargazers={args.stargazers} starred={args.starred} "
+        f"memory_budget={service.memory_budget} top={args.top}\n"
+        f"neighbours={counted.count} response={size / 2**20:.0f} MiB "
+        f"time={elapsed:.1f}s\n"
+        f"starred repos cache: {cache.size / 2**20:.0f} MiB estimated, "
+        f"max {cache.max_size / 2**20:.0f} MiB\n"
+        f"peak RSS: {before / 1024:.0f} MiB before the crawl, "
+        f"{_rss() / 1024:.0f} MiB after\n"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
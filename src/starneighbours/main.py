@@ -2,16 +2,59 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import asyncio
+import fcntl
+import os
+import tempfile
+from contextlib import asynccontextmanager, suppress
+from typing import IO, AsyncIterator
+
 from fastapi import FastAPI, Depends
 
-from .repositories.api import router
+from .repositories.api import router, watchlist_create
 from .auth import get_current_token
 
 
+def watchlist_lock_acquire() -> IO[bytes] | None:
+    """Lock the watchlist for this process, None if another one has it.
+
+    The lock is released when the returned file is closed, or when the process
+    exits.
+    """
+    path = os.environ.get(
+        "STARNEIGHBOURS_WATCHLIST_LOCK",
+        os.path.join(tempfile.gettempdir(), "starneighbours-watchlist.lock"),
+    )
+    lock = open(path, "ab")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # The watchlist is computed in the background, requests are served
+    # meanwhile. Only by one worker, so that the quota isn't multiplied.
+    watchlist = watchlist_create()
+    lock = watchlist_lock_acquire() if watchlist else None
+    task = asyncio.create_task(watchlist.run()) if watchlist and lock else None
+    yield
+    if task is not None:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    if lock is not None:
+        lock.close()
+
+
 app = FastAPI(
     title="Starneighbours",
     description="Find what stargazers of a repo have also starred.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Include routers
@@ -4,7 +4,7 @@
 
 from datetime import datetime
 from abc import ABC, abstractmethod
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class APIToken(BaseModel):
@@ -14,6 +14,32 @@ class APIToken(BaseModel):
     created_at: datetime
     updated_at: datetime
     comments: str = ""
+    # How long, in seconds, the responses served to this token stay fresh
+    cache_max_age: int = Field(default=300, ge=0)
+    # Share of the GitHub quota this token gets when tokens compete for it
+    weight: float = Field(default=1.0, gt=0)
+    # Maximum number of GitHub requests in flight at once for this token
+    max_concurrency: int = Field(default=4, ge=1)
+    # Maximum number of GitHub requests per hour, on top of the share of the
+    # GitHub quota given by the weight. Only the share if None.
+    hourly_quota: int | None = Field(default=None, ge=0)
+
+
+class APITokenUsage(BaseModel):
+    """GitHub requests consumed by an API token."""
+
+    name: str
+    weight: float
+    # Requests made in the current window
+    used: int
+    hourly_quota: int | None
+    # Requests per hour the token gets out of the GitHub quota, given the
+    # weights of the tokens that made requests in the last hour
+    share: int
+    # When the current window ends, None if no request was made yet
+    reset_at: datetime | None
+    in_flight: int
+    queued: int
 
 
 class APITokenRepository(ABC):
@@ -0,0 +1,144 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import hashlib
+import io
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import IO, Final, Iterable
+
+from pydantic import TypeAdapter
+
+from .github import GitHubUser, StarNeighbour
+
+_neighbour_adapter = TypeAdapter(StarNeighbour)
+
+# Proxies reject headers past 4 to 8 KB, e.g. nginx with its default buffers
+MAX_SKIPPED_HEADER_SIZE: Final[int] = 2048
+SKIPPED_TRUNCATED_MARKER: Final[str] = "..."
+
+
+@dataclass
+class CachedResponse:
+    # Serialized body, so that it is never serialized twice
+    content: bytes
+    etag: str
+    # When the data of the response was fetched
+    fetched_at: datetime
+    headers: dict[str, str] = field(default_factory=dict)
+    # Refreshed in the background: until then, served whatever its age, and
+    # never evicted. Past it, the refreshes stopped, so it's a usual response.
+    pinned_until: datetime | None = None
+
+    @property
+    def pinned(self) -> bool:
+        return (
+            self.pinned_until is not None
+            and datetime.now(tz=timezone.utc) < self.pinned_until
+        )
+
+
+class ResponseCacheRepository(ABC):
+    @abstractmethod
+    def get(self, key: str) -> CachedResponse | None:
+        """Get a cached response, None if there is none."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, response: CachedResponse) -> None:
+        """Cache a response, replacing the previous one if any."""
+        raise NotImplementedError
+
+
+def neighbours_cache_key(
+    user: str, repo: str, params: Iterable[tuple[str, str]] = ()
+) -> str:
+    """Key of the neighbours of a repository, for some query parameters."""
+    return f"{user}/{repo}?{sorted(params)}"
+
+
+def neighbours_write(neighbours: Iterable[StarNeighbour], file: IO[bytes]) -> str:
+    """Write the neighbours as a JSON array, one at a time.
+
+    Args:
+        neighbours: neighbours to serialize
+        file: where to write them
+
+    Returns:
+        The ETag of the JSON written
+    """
+    digest = hashlib.sha256()
+
+    def write(data: bytes) -> None:
+        file.write(data)
+        digest.update(data)
+
+    write(b"[")
+    for i, neighbour in enumerate(neighbours):
+        if i:
+            write(b",")
+        # Straight to JSON, without building a dict per stargazer first. Unset
+        # scores are left out, as they were before neighbours could be sorted.
+        write(_neighbour_adapter.dump_json(neighbour, exclude_none=True))
+    write(b"]")
+    return f'"{digest.hexdigest()}"'
+
+
+def neighbours_response_create(
+    neighbours: Iterable[StarNeighbour],
+    skipped: list[GitHubUser],
+    pinned_for: timedelta | None = None,
+    fetched_at: datetime | None = None,
+    body: IO[bytes] | None = None,
+) -> CachedResponse:
+    """Serialize the neighbours of a repository.
+
+    Args:
+        neighbours: neighbours to serialize
+        skipped: stargazers left out of the crawl
+        pinned_for: how long the response is pinned from now, if it is
+            refreshed in the background
+        fetched_at: when the oldest data the neighbours were computed from
+            was fetched, just now if not set
+        body: if set, the neighbours are written there and `content` is left
+            empty, for responses too large to keep in memory
+
+    Returns:
+        The response, with the number of stargazers skipped in
+        `X-Skipped-Stargazers-Count` and their logins in
+        `X-Skipped-Stargazers`, truncated and ended by `...` if too long
+    """
+    if body is None:
+        buffer = io.BytesIO()
+        etag = neighbours_write(neighbours, buffer)
+        content = buffer.getvalue()
+    else:
+        etag = neighbours_write(neighbours, body)
+        content = b""
+    now = datetime.now(tz=timezone.utc)
+    response = CachedResponse(
+        content=content,
+        etag=etag,
+        # HTTP dates have a precision of one second
+        fetched_at=(fetched_at or now).replace(microsecond=0),
+        pinned_until=None if pinned_for is None else now + pinned_for,
+    )
+    if skipped:
+        response.headers["X-Skipped-Stargazers-Count"] = str(len(skipped))
+        response.headers["X-Skipped-Stargazers"] = _skipped_header(skipped)
+    return response
+
+
+def _skipped_header(skipped: list[GitHubUser]) -> str:
+    logins: list[str] = []
+    size = 0
+    for stargazer in skipped:
+        # Leave room for the separator and the marker
+        size += len(stargazer.login) + 1
+        if size + len(SKIPPED_TRUNCATED_MARKER) > MAX_SKIPPED_HEADER_SIZE:
+            logins.append(SKIPPED_TRUNCATED_MARKER)
+            break
+        logins.append(stargazer.login)
+    return ",".join(logins)
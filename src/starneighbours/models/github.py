@@ -3,7 +3,9 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import StrEnum
 from typing import List, Optional
 
 
@@ -25,6 +27,66 @@ class GitHubRepo:
 class StarNeighbour:
     repo: str
     stargazers: List[GitHubUser]
+    score: Optional[float] = None
+    # When the score is an estimated number of stargazers in common, the real
+    # number is between score - error and score
+    error: Optional[int] = None
+
+
+class SortKey(StrEnum):
+    """How neighbours are ranked, from the most to the least similar.
+
+    - `shared`: number of stargazers in common.
+    - `jaccard`: shared / (target stars + neighbour stars - shared).
+    - `cosine`: shared / sqrt(target stars * neighbour stars).
+    - `lift`: how much more likely a target stargazer is to star the
+      neighbour than a random GitHub user.
+
+    The last three use `stargazers_count` so that very popular repositories
+    don't dominate every result.
+    """
+
+    SHARED = "shared"
+    JACCARD = "jaccard"
+    COSINE = "cosine"
+    LIFT = "lift"
+
+
+@dataclass
+class CrawlPolicy:
+    """Which stargazers of the target are worth fetching the starred repos of.
+
+    A stargazer with thousands of starred repos costs as many requests as
+    hundreds of ordinary users, and mostly adds noise to the result.
+    """
+
+    # Only stargazers that starred the target in this window, bounds included.
+    # Timezone-aware.
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    # Skip stargazers that starred more repos than this
+    max_starred: Optional[int] = None
+    # Maximum number of starred repos to fetch, over all the stargazers
+    budget: Optional[int] = None
+    # Fetch the stargazers with the fewest starred repos first, so that the
+    # budget is spent on as many stargazers as possible
+    cheapest_first: bool = False
+
+    @property
+    def needs_probe(self) -> bool:
+        return (
+            self.max_starred is not None
+            or self.budget is not None
+            or self.cheapest_first
+        )
+
+
+@dataclass
+class CrawlPlan:
+    # Stargazers to fetch the starred repos of, in that order
+    stargazers: List[GitHubUser]
+    # Stargazers left out by the policy
+    skipped: List[GitHubUser] = field(default_factory=list)
 
 
 class GitHubAPIError(Exception):
@@ -33,6 +95,18 @@ class GitHubAPIError(Exception):
     pass
 
 
+class RepositoryNotFoundError(GitHubAPIError):
+    """Raised when the repository doesn't exist in the source of the stars."""
+
+    pass
+
+
+class UnsupportedQueryError(GitHubAPIError):
+    """Raised when the source of the stars can't answer a query."""
+
+    pass
+
+
 class RateLimitError(Exception):
     """Raised when we hit the GitHub API rate limit."""
 
@@ -41,14 +115,37 @@ class RateLimitError(Exception):
         super().__init__(f"Rate limit exceeded. Reset at {reset_time}")
 
 
+class QuotaExceededError(Exception):
+    """Raised when an API token used all its share of the GitHub quota."""
+
+    def __init__(self, reset_time: int):
+        self.reset_time = reset_time
+        super().__init__(f"Quota exceeded. Reset at {reset_time}")
+
+
 class GitHubRepository(ABC):
+    @property
+    def oldest_fetched_at(self) -> Optional[datetime]:
+        """When the oldest data returned so far was fetched, None if just now."""
+        return None
+
     @abstractmethod
-    async def get_stargazers(self, user: str, repo: str) -> List[GitHubUser]:
+    async def get_stargazers(
+        self,
+        user: str,
+        repo: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[GitHubUser]:
         """Get all stargazers of a repository.
 
         Args:
             user: GitHub username
             repo: Repository name
+            since: If set, only the stargazers that starred it at or after
+                this timezone-aware date
+            until: If set, only the stargazers that starred it at or before
+                this timezone-aware date
 
         Returns:
             List of GitHub users who starred the repository
@@ -74,3 +171,21 @@ class GitHubRepository(ABC):
             RateLimitError: If we hit the GitHub API rate limit
         """
         pass
+
+    @abstractmethod
+    async def get_starred_repos_count(self, user: str) -> int:
+        """Get the number of repositories starred by a user.
+
+        It should be a lot cheaper than `get_starred_repos`.
+
+        Args:
+            user: GitHub username
+
+        Returns:
+            Number of repositories starred by the user
+
+        Raises:
+            GitHubAPIError: If the GitHub API returns an error
+            RateLimitError: If we hit the GitHub API rate limit
+        """
+        pass
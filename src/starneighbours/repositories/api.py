@@ -2,57 +2,454 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from functools import lru_cache
+from typing import IO, Awaitable, Final, Iterable, Iterator, TypeVar
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starneighbours.auth import get_current_token
+from starneighbours.models.api_token import APIToken, APITokenUsage
+from starneighbours.models.cache import (
+    CachedResponse,
+    ResponseCacheRepository,
+    neighbours_cache_key,
+    neighbours_response_create,
+)
 from starneighbours.models.github import (
+    CrawlPlan,
+    CrawlPolicy,
     GitHubRepository,
+    GitHubUser,
+    SortKey,
     StarNeighbour,
     GitHubAPIError,
+    QuotaExceededError,
     RateLimitError,
+    RepositoryNotFoundError,
+    UnsupportedQueryError,
 )
 from starneighbours.services.starneighbour import StarNeighbourService
+from starneighbours.services.watchlist import Watchlist
+from starneighbours.repositories.cached_github import (
+    CachedGitHubRepository,
+    StarredReposCache,
+)
 from starneighbours.repositories.github import GitHubAPIRepository
+from starneighbours.repositories.memory_cache import InMemoryResponseCacheRepository
+from starneighbours.repositories.pinned_cache import PinnedResponseCacheRepository
+from starneighbours.repositories.scheduler import FairScheduler
+from starneighbours.repositories.snapshot import SnapshotGitHubRepository
+from starneighbours.repositories.sqlite_response_cache import (
+    SQLiteResponseCacheRepository,
+)
 
 router = APIRouter()
 
+T = TypeVar("T")
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client disconnected before its response was ready."""
+
+    pass
+
+
+@lru_cache
+def get_snapshot(path: str) -> SnapshotGitHubRepository:
+    # Opened once per process, the pages are shared between workers
+    return SnapshotGitHubRepository(path)
+
+
+def starred_repos_cache_create(
+    ttl: timedelta = StarredReposCache.TTL,
+) -> StarredReposCache:
+    # Otherwise the cache could take more memory than the budget of crawls
+    memory_budget = os.environ.get("STARNEIGHBOURS_MEMORY_BUDGET")
+    if memory_budget:
+        return StarredReposCache(max_size=int(memory_budget), ttl=ttl)
+    return StarredReposCache(ttl=ttl)
+
+
+_starred_repos_cache = starred_repos_cache_create()
+_github_quota = os.environ.get("STARNEIGHBOURS_GITHUB_HOURLY_QUOTA")
+_scheduler = FairScheduler(
+    github_quota=int(_github_quota) if _github_quota else FairScheduler.GITHUB_QUOTA
+)
+
+
+async def get_scheduler() -> FairScheduler:
+    return _scheduler
+
+
+def github_repo_create(
+    token: APIToken,
+    scheduler: FairScheduler,
+    starred_repos_cache: StarredReposCache = _starred_repos_cache,
+) -> GitHubRepository:
+    snapshot_path = os.environ.get("STARNEIGHBOURS_SNAPSHOT")
+    if snapshot_path:
+        return get_snapshot(snapshot_path)
+    return CachedGitHubRepository(
+        GitHubAPIRepository(scheduler=scheduler, api_token=token),
+        starred_repos_cache,
+        # Otherwise the response would be older than the token accepts
+        max_age=timedelta(seconds=token.cache_max_age),
+    )
+
 
-async def get_github_repo() -> GitHubRepository:
-    return GitHubAPIRepository()
+async def get_github_repo(
+    token: APIToken = Depends(get_current_token),
+    scheduler: FairScheduler = Depends(get_scheduler),
+) -> GitHubRepository:
+    return github_repo_create(token, scheduler)
+
+
+def response_cache_create() -> InMemoryResponseCacheRepository:
+    # Otherwise the cache could take more memory than the budget of crawls
+    memory_budget = os.environ.get("STARNEIGHBOURS_MEMORY_BUDGET")
+    if memory_budget:
+        return InMemoryResponseCacheRepository(max_size=int(memory_budget))
+    return InMemoryResponseCacheRepository()
+
+
+_response_cache = response_cache_create()
+
+
+async def get_response_cache() -> ResponseCacheRepository:
+    # Pinned by the watchlist in another worker, maybe
+    return PinnedResponseCacheRepository(
+        _response_cache, SQLiteResponseCacheRepository()
+    )
+
+
+def starneighbour_service_create(github_repo: GitHubRepository) -> StarNeighbourService:
+    memory_budget = os.environ.get("STARNEIGHBOURS_MEMORY_BUDGET")
+    return StarNeighbourService(
+        github_repo, memory_budget=int(memory_budget) if memory_budget else None
+    )
 
 
 async def get_starneighbour_service(
     github_repo: GitHubRepository = Depends(get_github_repo),
 ) -> StarNeighbourService:
-    return StarNeighbourService(github_repo)
+    return starneighbour_service_create(github_repo)
+
+
+WATCHLIST_HOURLY_QUOTA: Final[int] = 1000
+
+
+def watchlist_create() -> Watchlist | None:
+    """Create the watchlist set in the environment, None if there is none.
+
+    `STARNEIGHBOURS_WATCHLIST` lists the `owner/repo` targets, separated by
+    commas. The watchlist refreshes them every
+    `STARNEIGHBOURS_WATCHLIST_INTERVAL` seconds, with at most
+    `STARNEIGHBOURS_WATCHLIST_HOURLY_QUOTA` GitHub requests per hour, and
+    gives way to the requests of the clients. Its starred repos are cached
+    apart, for an interval, so that a refresh that waits for the quota
+    resumes where it stopped.
+
+    With several workers, only the one that holds the lock of the watchlist
+    runs it, see `main`. It pins its results in the database of the API
+    tokens, where every worker reads them.
+
+    Raises:
+        ValueError: If a target isn't of the form `owner/repo`
+    """
+    targets: list[tuple[str, str]] = []
+    for target in os.environ.get("STARNEIGHBOURS_WATCHLIST", "").split(","):
+        if not target.strip():
+            continue
+        user, _, repo = target.strip().partition("/")
+        if not user or not repo or "/" in repo:
+            raise ValueError(f"{target!r} is not of the form owner/repo")
+        targets.append((user, repo))
+    if not targets:
+        return None
+
+    interval = os.environ.get("STARNEIGHBOURS_WATCHLIST_INTERVAL")
+    quota = os.environ.get("STARNEIGHBOURS_WATCHLIST_HOURLY_QUOTA")
+    now = datetime.now(tz=timezone.utc)
+    # Not in the database, whose ids start at 1
+    refresh_interval = (
+        timedelta(seconds=int(interval)) if interval else Watchlist.REFRESH_INTERVAL
+    )
+    token = APIToken(
+        id=0,
+        name="watchlist",
+        hashed_token="",
+        created_at=now,
+        updated_at=now,
+        # Starred repos cached by the previous refresh are too old
+        cache_max_age=int(refresh_interval.total_seconds()),
+        weight=0.5,
+        hourly_quota=int(quota) if quota else WATCHLIST_HOURLY_QUOTA,
+    )
+    starred_repos_cache = starred_repos_cache_create(ttl=refresh_interval)
+    return Watchlist(
+        lambda: starneighbour_service_create(
+            github_repo_create(token, _scheduler, starred_repos_cache)
+        ),
+        SQLiteResponseCacheRepository(),
+        targets,
+        refresh_interval=refresh_interval,
+    )
 
 
 @router.get("/repos/{user}/{repo}/starneighbours", response_model=list[StarNeighbour])
 async def get_starneighbours(
     user: str,
     repo: str,
+    request: Request,
+    sort: SortKey | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    max_starred: int | None = Query(None, ge=0),
+    budget: int | None = Query(None, ge=0),
+    cheapest_first: bool = False,
+    top: int | None = Query(None, ge=1),
+    exact: bool = False,
+    if_none_match: str | None = Header(None),
+    token: APIToken = Depends(get_current_token),
+    cache: ResponseCacheRepository = Depends(get_response_cache),
+    github_repo: GitHubRepository = Depends(get_github_repo),
     service: StarNeighbourService = Depends(get_starneighbour_service),
-) -> list[StarNeighbour]:
+) -> Response:
     """Get repositories that share stargazers with the given repository.
 
     Args:
         user: GitHub username
         repo: Repository name
+        request: Request, used as the cache key and to watch for disconnects
+        sort: Similarity used to rank the neighbours, unsorted if not set
+        since: Only crawl the stargazers that starred the repository at or
+            after this date, UTC if no timezone is given
+        until: Only crawl the stargazers that starred the repository at or
+            before this date, UTC if no timezone is given
+        max_starred: Skip stargazers that starred more repos than this
+        budget: Maximum number of starred repos to fetch overall
+        cheapest_first: Crawl the stargazers with the fewest starred repos first
+        top: Only the neighbours with the most stargazers in common, estimated
+            in bounded memory
+        exact: With `top`, crawl again to get the exact stargazers in common
+        if_none_match: ETags of the responses the client already has
+        token: API token of the client, which sets the freshness of responses
+        cache: Cache of the responses
+        github_repo: Source of the stars of the service, which tells how old
+            they are
         service: StarNeighbourService instance
 
     Returns:
-        List of repositories that share stargazers with the given repository
+        List of repositories that share stargazers with the given repository.
+        Repositories in the watchlist are served from the cache with the
+        default parameters, as long as they are refreshed.
+        Stargazers left out by the crawl policy are counted in the
+        `X-Skipped-Stargazers-Count` header, and listed in the
+        `X-Skipped-Stargazers` header, truncated if too long.
+        Past the memory budget, the response is streamed from a temporary
+        file, and not cached.
+        If the client already has it (see `If-None-Match`), an empty 304.
+        If the client disconnects, the crawl is cancelled: what was fetched
+        so far is kept, and reused if the request is retried. The response,
+        that nobody reads, is an empty 499.
 
     Raises:
-        HTTPException: If the GitHub API returns an error or rate limit is exceeded
+        HTTPException: If the repository doesn't exist in the snapshot, the
+            snapshot can't answer the query, the GitHub API returns an error,
+            or the rate limit or the quota of the token is exceeded
     """
-    try:
-        return await service.find_neighbours(user, repo)
-    except RateLimitError as e:
-        raise HTTPException(
-            status_code=429,
-            detail=f"GitHub API rate limit exceeded. Reset at {e.reset_time}",
-        ) from e
-    except GitHubAPIError as e:
+    if top is not None and sort not in (None, SortKey.SHARED):
         raise HTTPException(
-            status_code=500,
-            detail="Error fetching data from GitHub API",
-        ) from e
+            status_code=422,
+            detail="top neighbours can only be sorted by shared stargazers",
+        )
+
+    key = neighbours_cache_key(user, repo, request.query_params.multi_items())
+    cached = cache.get(key)
+    body: IO[bytes] | None = None
+    if cached is None or (
+        not cached.pinned
+        and datetime.now(tz=timezone.utc) - cached.fetched_at
+        >= timedelta(seconds=token.cache_max_age)
+    ):
+
+        async def crawl() -> tuple[CrawlPlan, Iterable[StarNeighbour]]:
+            policy = CrawlPolicy(
+                since=_as_utc(since),
+                until=_as_utc(until),
+                max_starred=max_starred,
+                budget=budget,
+                cheapest_first=cheapest_first,
+            )
+            plan = await service.plan_crawl(user, repo, policy)
+            if top is not None:
+                return plan, await service.find_top_neighbours(
+                    user, repo, top, plan=plan, exact=exact
+                )
+            return plan, await service.iter_neighbours(user, repo, sort=sort, plan=plan)
+
+        try:
+            plan, neighbours = await cancel_on_disconnect(request, crawl())
+        except ClientDisconnectedError:
+            # Letting the cancellation out would have it logged as an error
+            return Response(status_code=499)
+        except RateLimitError as e:
+            raise HTTPException(
+                status_code=429,
+                detail=f"GitHub API rate limit exceeded. Reset at {e.reset_time}",
+            ) from e
+        except QuotaExceededError as e:
+            raise HTTPException(
+                status_code=429,
+                detail=f"API token quota exceeded. Reset at {e.reset_time}",
+            ) from e
+        except RepositoryNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e)) from e
+        except UnsupportedQueryError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except GitHubAPIError as e:
+            raise HTTPException(
+                status_code=500,
+                detail="Error fetching data from GitHub API",
+            ) from e
+
+        cached, body = _neighbours_response(
+            neighbours,
+            plan.skipped,
+            github_repo.oldest_fetched_at,
+            service.memory_budget,
+        )
+        del neighbours
+        if body is None:
+            cache.set(key, cached)
+
+    age = max(0.0, (datetime.now(tz=timezone.utc) - cached.fetched_at).total_seconds())
+    headers = {
+        **cached.headers,
+        "ETag": cached.etag,
+        "Last-Modified": format_datetime(cached.fetched_at, usegmt=True),
+        # must-revalidate lets shared caches store responses to authenticated
+        # requests, see RFC 9111 section 3.5
+        "Cache-Control": f"max-age={max(0, int(token.cache_max_age - age))}, must-revalidate",
+        "Vary": "Authorization",
+    }
+    if if_none_match is not None and _etag_matches(if_none_match, cached.etag):
+        if body is not None:
+            body.close()
+        return Response(status_code=304, headers=headers)
+    if body is not None:
+        return StreamingResponse(
+            _read_and_close(body), media_type="application/json", headers=headers
+        )
+    return Response(cached.content, media_type="application/json", headers=headers)
+
+
+RESPONSE_READ_SIZE: Final[int] = 64 * 1024
+
+
+def _neighbours_response(
+    neighbours: Iterable[StarNeighbour],
+    skipped: list[GitHubUser],
+    fetched_at: datetime | None,
+    memory_budget: int | None,
+) -> tuple[CachedResponse, IO[bytes] | None]:
+    """Serialize the neighbours, in memory if they fit in the budget.
+
+    Returns:
+        The response, and the file of its body if it didn't fit in the
+        budget: the response is then too large to be cached, and its
+        `content` is empty
+    """
+    if memory_budget is None:
+        return neighbours_response_create(
+            neighbours, skipped, fetched_at=fetched_at
+        ), None
+
+    body = tempfile.SpooledTemporaryFile(max_size=memory_budget)
+    response = neighbours_response_create(
+        neighbours, skipped, fetched_at=fetched_at, body=body
+    )
+    too_large = body.tell() > memory_budget
+    body.seek(0)
+    if too_large:
+        return response, body
+    with body:
+        response.content = body.read()
+    return response, None
+
+
+def _read_and_close(body: IO[bytes]) -> Iterator[bytes]:
+    with body:
+        while chunk := body.read(RESPONSE_READ_SIZE):
+            yield chunk
+
+
+def _as_utc(date: datetime | None) -> datetime | None:
+    if date is None or date.tzinfo is not None:
+        return date
+    return date.replace(tzinfo=timezone.utc)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, see RFC 9110 section 13.1.2
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+@router.get("/quota", response_model=APITokenUsage)
+async def get_quota(
+    token: APIToken = Depends(get_current_token),
+    scheduler: FairScheduler = Depends(get_scheduler),
+) -> APITokenUsage:
+    """Get the GitHub requests consumed by the current API token.
+
+    Args:
+        token: API token of the client
+        scheduler: Scheduler of the GitHub requests
+
+    Returns:
+        Requests made in the current window, quota and requests pending
+    """
+    return scheduler.usage(token)
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await something, but cancel it if the client disconnects meanwhile.
+
+    Raises:
+        ClientDisconnectedError: If the client disconnected
+        asyncio.CancelledError: If the caller itself was cancelled
+    """
+    task = asyncio.ensure_future(awaitable)
+    disconnected = False
+
+    async def watch() -> None:
+        nonlocal disconnected
+        # The body of the request has already been read (there is none), so
+        # the next message can only be the disconnection
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        disconnected = True
+        task.cancel()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        current = asyncio.current_task()
+        if disconnected and (current is None or not current.cancelling()):
+            raise ClientDisconnectedError() from None
+        raise
+    finally:
+        watcher.cancel()
+        # Doesn't raise the cancellation of the watcher, only of the caller
+        await asyncio.wait([watcher])
@@ -0,0 +1,146 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Final
+
+from ..models.github import GitHubRepo, GitHubRepository, GitHubUser
+
+
+class StarredReposCache:
+    """Starred repos of the most recently crawled users, shared by requests.
+
+    Bounded by the estimated size in bytes of the starred repos kept, entries
+    also expire.
+    """
+
+    MAX_SIZE: Final[int] = 128 * 1024 * 1024
+    # Rough size of a repo in memory, on top of its strings
+    REPO_SIZE: Final[int] = 300
+    TTL: Final[timedelta] = timedelta(minutes=15)
+
+    def __init__(self, max_size: int = MAX_SIZE, ttl: timedelta = TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        # login -> (fetched_at, starred repos, their size)
+        self._starred: OrderedDict[str, tuple[datetime, list[GitHubRepo], int]] = (
+            OrderedDict()
+        )
+
+    def get(self, login: str) -> list[GitHubRepo] | None:
+        entry = self.get_entry(login)
+        return None if entry is None else entry[1]
+
+    def get_entry(
+        self, login: str, max_age: timedelta | None = None
+    ) -> tuple[datetime, list[GitHubRepo]] | None:
+        """Get the starred repos of a user, and when they were fetched.
+
+        Args:
+            login: login of the user
+            max_age: if set, None if the repos were fetched longer ago
+
+        Returns:
+            When the repos were fetched and the repos, None if not cached
+        """
+        entry = self._starred.get(login)
+        if entry is None:
+            return None
+        fetched_at, repos, _ = entry
+        age = datetime.now(tz=timezone.utc) - fetched_at
+        if age > self.ttl:
+            self._remove(login)
+            return None
+        if max_age is not None and age > max_age:
+            # Still fresh enough for other requests
+            return None
+        self._starred.move_to_end(login)
+        return fetched_at, repos
+
+    def set(self, login: str, repos: list[GitHubRepo]) -> None:
+        self._remove(login)
+        size = sum(map(self._repo_size, repos))
+        if size > self.max_size:
+            return
+
+        self._starred[login] = (datetime.now(tz=timezone.utc), repos, size)
+        self.size += size
+        while self.size > self.max_size:
+            self._remove(next(iter(self._starred)))
+
+    def _repo_size(self, repo: GitHubRepo) -> int:
+        return (
+            self.REPO_SIZE
+            + len(repo.name)
+            + len(repo.full_name)
+            + len(repo.description or "")
+            + len(repo.html_url)
+        )
+
+    def _remove(self, login: str) -> None:
+        entry = self._starred.pop(login, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+class CachedGitHubRepository(GitHubRepository):
+    """Remember the starred repos fetched by another GitHub repository.
+
+    A crawl stopped in the middle, e.g. because the client disconnected,
+    resumes where it stopped when the request is retried. The starred repos
+    cached are used as long as they are younger than `max_age`, and
+    `oldest_fetched_at` tells when the oldest of the data returned was
+    fetched.
+    """
+
+    def __init__(
+        self,
+        github_repo: GitHubRepository,
+        cache: StarredReposCache,
+        max_age: timedelta | None = None,
+    ):
+        self.github_repo = github_repo
+        self.cache = cache
+        self.max_age = max_age
+        self._oldest_fetched_at: datetime | None = None
+
+    @property
+    def oldest_fetched_at(self) -> datetime | None:
+        return self._oldest_fetched_at
+
+    async def get_stargazers(
+        self,
+        user: str,
+        repo: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[GitHubUser]:
+        self._fetched(datetime.now(tz=timezone.utc))
+        return await self.github_repo.get_stargazers(user, repo, since, until)
+
+    async def get_starred_repos(self, user: str) -> list[GitHubRepo]:
+        entry = self.cache.get_entry(user, self.max_age)
+        if entry is not None:
+            self._fetched(entry[0])
+            return entry[1]
+
+        self._fetched(datetime.now(tz=timezone.utc))
+        repos = await self.github_repo.get_starred_repos(user)
+        self.cache.set(user, repos)
+        return repos
+
+    async def get_starred_repos_count(self, user: str) -> int:
+        entry = self.cache.get_entry(user, self.max_age)
+        if entry is not None:
+            self._fetched(entry[0])
+            return len(entry[1])
+
+        self._fetched(datetime.now(tz=timezone.utc))
+        return await self.github_repo.get_starred_repos_count(user)
+
+    def _fetched(self, fetched_at: datetime) -> None:
+        if self._oldest_fetched_at is None or fetched_at < self._oldest_fetched_at:
+            self._oldest_fetched_at = fetched_at
@@ -3,15 +3,20 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 import os
+from datetime import datetime
+from contextlib import AbstractAsyncContextManager, nullcontext
 from typing import Any, Final
 import httpx
+from ..models.api_token import APIToken
 from ..models.github import (
     GitHubRepo,
     GitHubRepository,
     GitHubUser,
     GitHubAPIError,
     RateLimitError,
+    UnsupportedQueryError,
 )
+from .scheduler import FairScheduler
 
 
 class GitHubAPIRepository(GitHubRepository):
@@ -19,8 +24,29 @@ class GitHubAPIRepository(GitHubRepository):
     MAX_PAGES: Final[int] = 100_000
     # see https://docs.github.com/en/rest/activity/starring?apiVersion=2022-11-28#list-repositories-starred-by-the-authenticated-user
     PER_PAGE: Final[int] = 100
-
-    def __init__(self, token: str | None = None):
+    # Adds starred_at to the stargazers, see https://docs.github.com/en/rest/activity/starring?apiVersion=2022-11-28#list-stargazers
+    STAR_MEDIA_TYPE: Final[str] = "application/vnd.github.star+json"
+    # GitHub only lists the oldest 400 pages of stargazers, see
+    # https://docs.github.com/en/rest/activity/starring?apiVersion=2022-11-28#list-stargazers
+    MAX_STARGAZER_PAGES: Final[int] = 400
+
+    def __init__(
+        self,
+        token: str | None = None,
+        scheduler: FairScheduler | None = None,
+        api_token: APIToken | None = None,
+    ):
+        """
+        Args:
+            token: GitHub token, read from the `GITHUB_TOKEN` env variable if not set
+            scheduler: Shares the requests to GitHub between API tokens
+            api_token: API token on behalf of which requests are made, required
+                with a scheduler
+        """
+        if scheduler is not None and api_token is None:
+            raise ValueError("An API token is required to schedule requests")
+        self.scheduler = scheduler
+        self.api_token = api_token
         self.token = token or os.environ.get("GITHUB_TOKEN")
         if not self.token:
             raise ValueError("GitHub token is required")
@@ -30,15 +56,25 @@ class GitHubAPIRepository(GitHubRepository):
             "Authorization": f"token {self.token}",
         }
 
-    async def _make_request(
-        self, method: str, path: str, params: dict[str, int | str]
-    ) -> list[dict[str, Any]]:
-        async with httpx.AsyncClient() as client:
+    def _slot(self) -> AbstractAsyncContextManager[None]:
+        if self.scheduler is None or self.api_token is None:
+            return nullcontext()
+        return self.scheduler.slot(self.api_token)
+
+    async def _send_request(
+        self,
+        method: str,
+        path: str,
+        params: dict[str, int | str],
+        accept: str | None = None,
+    ) -> httpx.Response:
+        headers = self.headers if accept is None else {**self.headers, "Accept": accept}
+        async with self._slot(), httpx.AsyncClient() as client:
             response = await client.request(
                 method,
                 f"{self.base_url}{path}",
-                params={**params, "per_page": self.PER_PAGE},
-                headers=self.headers,
+                params={"per_page": self.PER_PAGE, **params},
+                headers=headers,
             )
 
             if response.status_code == 403 and "x-ratelimit-reset" in response.headers:
@@ -50,9 +86,36 @@ class GitHubAPIRepository(GitHubRepository):
                     f"GitHub API error: {response.status_code} - {response.text}"
                 )
 
-            return response.json()
+            return response
+
+    async def _make_request(
+        self, method: str, path: str, params: dict[str, int | str]
+    ) -> list[dict[str, Any]]:
+        response = await self._send_request(method, path, params)
+        return response.json()
+
+    @staticmethod
+    def _last_page(response: httpx.Response) -> int | None:
+        """Number of the last page, None if everything fits in this one."""
+        last_url = response.links.get("last", {}).get("url")
+        if last_url is None:
+            return None
+
+        try:
+            return int(httpx.URL(last_url).params["page"])
+        except (KeyError, ValueError) as e:
+            raise GitHubAPIError(f"Unexpected pagination link: {last_url}") from e
+
+    async def get_stargazers(
+        self,
+        user: str,
+        repo: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[GitHubUser]:
+        if since is not None or until is not None:
+            return await self._get_stargazers_between(user, repo, since, until)
 
-    async def get_stargazers(self, user: str, repo: str) -> list[GitHubUser]:
         stargazers = []
         page = 1
 
@@ -73,6 +136,55 @@ class GitHubAPIRepository(GitHubRepository):
 
         return stargazers
 
+    async def _get_stargazers_between(
+        self,
+        user: str,
+        repo: str,
+        since: datetime | None,
+        until: datetime | None,
+    ) -> list[GitHubUser]:
+        # Stargazers are listed from the oldest to the newest star: walk the
+        # pages backward, and stop at the first star older than `since`
+        path = f"/repos/{user}/{repo}/stargazers"
+        first_page = await self._send_request(
+            "GET", path, {"page": 1}, accept=self.STAR_MEDIA_TYPE
+        )
+        page = self._last_page(first_page) or 1
+        if page > self.MAX_PAGES:
+            raise GitHubAPIError(f"Too many pages of stargazers: {page}")
+        if page >= self.MAX_STARGAZER_PAGES:
+            # The most recent stars are past the last page listed: walking
+            # backward would start from a star older than the window
+            response = await self._send_request("GET", f"/repos/{user}/{repo}", {})
+            stargazers_count = response.json()["stargazers_count"]
+            if stargazers_count > page * self.PER_PAGE:
+                raise UnsupportedQueryError(
+                    f"{user}/{repo} has {stargazers_count} stargazers, GitHub "
+                    f"only lists the oldest {page * self.PER_PAGE}: the window "
+                    "of a query can't be applied"
+                )
+
+        stargazers: list[GitHubUser] = []
+        while page >= 1:
+            response = (
+                first_page
+                if page == 1
+                else await self._send_request(
+                    "GET", path, {"page": page}, accept=self.STAR_MEDIA_TYPE
+                )
+            )
+            for star in reversed(response.json()):
+                starred_at = datetime.fromisoformat(star["starred_at"])
+                if until is not None and starred_at > until:
+                    continue
+                if since is not None and starred_at < since:
+                    return stargazers[::-1]
+                stargazers.append(GitHubUser(login=star["user"]["login"]))
+
+            page -= 1
+
+        return stargazers[::-1]
+
     async def get_starred_repos(self, user: str) -> list[GitHubRepo]:
         repos = []
         page = 1
@@ -101,3 +213,16 @@ class GitHubAPIRepository(GitHubRepository):
             page += 1
 
         return repos
+
+    async def get_starred_repos_count(self, user: str) -> int:
+        # With one item per page, the number of the last page is the number
+        # of items. See https://docs.github.com/en/rest/using-the-rest-api/using-pagination-in-the-rest-api
+        response = await self._send_request(
+            method="GET",
+            path=f"/users/{user}/starred",
+            params={"page": 1, "per_page": 1},
+        )
+        last_page = self._last_page(response)
+        if last_page is None:
+            return len(response.json())
+        return last_page
@@ -0,0 +1,47 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from collections import OrderedDict
+from typing import Final
+
+from ..models.cache import CachedResponse, ResponseCacheRepository
+
+
+class InMemoryResponseCacheRepository(ResponseCacheRepository):
+    """Least recently used responses, in the memory of the process.
+
+    Pinned responses are never evicted, but count in the size of the cache.
+    """
+
+    # Responses can weight megabytes, so the cache is bounded in bytes
+    MAX_SIZE: Final[int] = 256 * 1024 * 1024
+
+    def __init__(self, max_size: int = MAX_SIZE) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._responses: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def get(self, key: str) -> CachedResponse | None:
+        response = self._responses.get(key)
+        if response is not None:
+            self._responses.move_to_end(key)
+        return response
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        previous = self._responses.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.content)
+        if len(response.content) > self.max_size and not response.pinned:
+            return
+
+        self._responses[key] = response
+        self.size += len(response.content)
+        while self.size > self.max_size:
+            evicted_key = next(
+                (k for k, cached in self._responses.items() if not cached.pinned),
+                None,
+            )
+            if evicted_key is None:
+                return
+            self.size -= len(self._responses.pop(evicted_key).content)
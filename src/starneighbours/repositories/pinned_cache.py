@@ -0,0 +1,33 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from ..models.cache import CachedResponse, ResponseCacheRepository
+
+
+class PinnedResponseCacheRepository(ResponseCacheRepository):
+    """Pinned responses in a shared cache, the others in a local one.
+
+    The pinned responses, refreshed in the background by a single worker, are
+    then served by every worker, while the others stay in the memory of the
+    worker that computed them.
+    """
+
+    def __init__(
+        self, local: ResponseCacheRepository, pinned: ResponseCacheRepository
+    ) -> None:
+        self.local = local
+        self.pinned = pinned
+
+    def get(self, key: str) -> CachedResponse | None:
+        response = self.pinned.get(key)
+        if response is not None and response.pinned:
+            return response
+        # No longer refreshed, so computed again like any other response
+        return self.local.get(key)
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        if response.pinned:
+            self.pinned.set(key, response)
+        else:
+            self.local.set(key, response)
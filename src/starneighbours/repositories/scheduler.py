@@ -0,0 +1,166 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Final
+
+from ..models.api_token import APIToken, APITokenUsage
+from ..models.github import QuotaExceededError
+
+
+@dataclass
+class _Client:
+    token: APIToken
+    used: int = 0
+    window_start: datetime | None = None
+    in_flight: int = 0
+    # Finish tag of the last request queued
+    last_finish: float = 0.0
+    # (finish tag, waiter) of the queued requests, in order
+    queue: deque[tuple[float, "asyncio.Future[None]"]] = field(default_factory=deque)
+
+
+class FairScheduler:
+    """Share the GitHub requests between API tokens with weighted fair queueing.
+
+    All the clients use the same GitHub token, so the same GitHub quota. Each
+    request waits for one of the `max_concurrency` slots; when a slot frees,
+    it goes to the queued request with the lowest virtual finish time, which
+    grows by 1 / weight with each request of a token. A token with a weight
+    of 2 is then served twice as often as a token with a weight of 1 when they
+    compete, and a small interactive query isn't stuck behind a batch crawl.
+
+    The GitHub quota itself, `github_quota` requests per hour, is split by
+    weight between the tokens that made requests in the last hour: a batch
+    crawl can't use it all up while other tokens need some. Each token is
+    also capped by its own `max_concurrency` and `hourly_quota`.
+    All of this is enforced per process: with several workers, each has its
+    own.
+    """
+
+    MAX_CONCURRENCY: Final[int] = 8
+    # Requests per hour of a GitHub personal access token
+    GITHUB_QUOTA: Final[int] = 5000
+    QUOTA_WINDOW: Final[timedelta] = timedelta(hours=1)
+
+    def __init__(
+        self, max_concurrency: int = MAX_CONCURRENCY, github_quota: int = GITHUB_QUOTA
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.github_quota = github_quota
+        self.in_flight = 0
+        self._virtual_time = 0.0
+        self._clients: dict[int, _Client] = {}
+
+    def _client(self, token: APIToken) -> _Client:
+        client = self._clients.setdefault(token.id, _Client(token=token))
+        # Weight and caps may have been changed in the database
+        client.token = token
+        now = datetime.now(tz=timezone.utc)
+        if client.window_start and now - client.window_start >= self.QUOTA_WINDOW:
+            client.used = 0
+            client.window_start = None
+        return client
+
+    @asynccontextmanager
+    async def slot(self, token: APIToken) -> AsyncIterator[None]:
+        """Wait for the turn of the token to make one GitHub request.
+
+        Raises:
+            QuotaExceededError: If the token used its hourly quota
+        """
+        client = self._client(token)
+        if client.window_start is None:
+            client.window_start = datetime.now(tz=timezone.utc)
+        if client.used >= self._quota(client):
+            reset_at = client.window_start + self.QUOTA_WINDOW
+            raise QuotaExceededError(int(reset_at.timestamp()))
+        client.used += 1
+
+        finish = max(self._virtual_time, client.last_finish) + 1 / token.weight
+        client.last_finish = finish
+        waiter = asyncio.get_running_loop().create_future()
+        client.queue.append((finish, waiter))
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was given right before the cancellation
+                self._release(client)
+            else:
+                # No GitHub request was made, it doesn't count in the quota
+                client.used -= 1
+                if (finish, waiter) in client.queue:
+                    client.queue.remove((finish, waiter))
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(client)
+
+    def _share(self, client: _Client) -> int:
+        """Requests per window the token gets out of the GitHub quota."""
+        now = datetime.now(tz=timezone.utc)
+        total_weight = client.token.weight + sum(
+            other.token.weight
+            for other in self._clients.values()
+            if other is not client
+            and other.window_start is not None
+            and now - other.window_start < self.QUOTA_WINDOW
+        )
+        return int(self.github_quota * client.token.weight / total_weight)
+
+    def _quota(self, client: _Client) -> int:
+        if client.token.hourly_quota is None:
+            return self._share(client)
+        return min(self._share(client), client.token.hourly_quota)
+
+    def _release(self, client: _Client) -> None:
+        self.in_flight -= 1
+        client.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrency:
+            ready = [
+                client
+                for client in self._clients.values()
+                if client.queue and client.in_flight < client.token.max_concurrency
+            ]
+            if not ready:
+                return
+
+            client = min(ready, key=lambda client: client.queue[0][0])
+            finish, waiter = client.queue.popleft()
+            if waiter.cancelled():
+                continue
+            self._virtual_time = max(
+                self._virtual_time, finish - 1 / client.token.weight
+            )
+            self.in_flight += 1
+            client.in_flight += 1
+            waiter.set_result(None)
+
+    def usage(self, token: APIToken) -> APITokenUsage:
+        """Report the GitHub requests consumed by a token."""
+        client = self._client(token)
+        return APITokenUsage(
+            name=token.name,
+            weight=token.weight,
+            used=client.used,
+            hourly_quota=token.hourly_quota,
+            share=self._share(client),
+            reset_at=(
+                client.window_start + self.QUOTA_WINDOW if client.window_start else None
+            ),
+            in_flight=client.in_flight,
+            queued=len(client.queue),
+        )
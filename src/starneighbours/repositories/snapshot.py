@@ -0,0 +1,230 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import bisect
+import mmap
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Final, Mapping, Sequence
+
+import numpy as np
+import numpy.typing as npt
+from scipy.sparse import coo_matrix
+
+from ..models.github import (
+    GitHubRepo,
+    GitHubRepository,
+    GitHubUser,
+    RepositoryNotFoundError,
+    UnsupportedQueryError,
+)
+
+
+class SnapshotGitHubRepository(GitHubRepository):
+    """Read-only star graph, memory-mapped from a snapshot file.
+
+    The file is never loaded: arrays are views over the mapping, so opening a
+    snapshot is instant whatever its size, and the pages are shared by all
+    the worker processes that open the same file.
+
+    It only knows the stars of the users it was created with: the stargazers
+    of a repo are the ones found in the snapshot.
+
+    Layout, little-endian, every section aligned on 8 bytes:
+        header: magic, version, number of users, repos and edges
+        u64[users + 1]  offsets of the logins in the logins blob
+        u64[repos + 1]  offsets of the full names in the repos blob
+        i64[repos]      stargazers_count of each repo
+        u64[users + 1]  CSR indptr, user -> starred repos
+        u32[edges]      CSR indices
+        u64[repos + 1]  CSC indptr, repo -> stargazers
+        u32[edges]      CSC indices
+        logins blob, then full names blob, sorted by their utf-8 bytes
+    """
+
+    MAGIC: Final[bytes] = b"STARNBRS"
+    VERSION: Final[int] = 1
+    HEADER: Final[struct.Struct] = struct.Struct("<8sI4xQQQ")
+
+    def __init__(self, path: Path | str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_users, n_repos, n_edges = self.HEADER.unpack_from(self._mmap)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{path} is not a star graph snapshot")
+        self.n_users, self.n_repos, self.n_edges = n_users, n_repos, n_edges
+
+        self._offset = self.HEADER.size
+        self._user_offsets = self._array(np.uint64, n_users + 1)
+        self._repo_offsets = self._array(np.uint64, n_repos + 1)
+        self._repo_stars = self._array(np.int64, n_repos)
+        self._user_indptr = self._array(np.uint64, n_users + 1)
+        self._user_indices = self._array(np.uint32, n_edges)
+        self._repo_indptr = self._array(np.uint64, n_repos + 1)
+        self._repo_indices = self._array(np.uint32, n_edges)
+        self._user_blob = self._blob(int(self._user_offsets[-1]))
+        self._repo_blob = self._blob(int(self._repo_offsets[-1]))
+
+    def _array(self, dtype: type[np.generic], count: int) -> npt.NDArray[Any]:
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._offset)
+        self._offset += _aligned(array.nbytes)
+        return array
+
+    def _blob(self, size: int) -> memoryview:
+        blob = memoryview(self._mmap)[self._offset : self._offset + size]
+        self._offset += _aligned(size)
+        return blob
+
+    def close(self) -> None:
+        # Views must be gone before the mapping can be closed
+        del self._user_offsets, self._repo_offsets, self._repo_stars
+        del self._user_indptr, self._user_indices
+        del self._repo_indptr, self._repo_indices
+        self._user_blob.release()
+        self._repo_blob.release()
+        self._mmap.close()
+
+    def _login(self, index: int) -> str:
+        start, end = self._user_offsets[index : index + 2]
+        return str(self._user_blob[start:end], "utf-8")
+
+    def _full_name(self, index: int) -> str:
+        start, end = self._repo_offsets[index : index + 2]
+        return str(self._repo_blob[start:end], "utf-8")
+
+    def _find(
+        self, offsets: npt.NDArray[np.uint64], blob: memoryview, name: str
+    ) -> int | None:
+        # Names are sorted, so this is a binary search over the blob
+        key = name.encode()
+        size = len(offsets) - 1
+        index = bisect.bisect_left(
+            range(size), key, key=lambda i: bytes(blob[offsets[i] : offsets[i + 1]])
+        )
+        if index < size and bytes(blob[offsets[index] : offsets[index + 1]]) == key:
+            return index
+        return None
+
+    def _repo(self, index: int) -> GitHubRepo:
+        full_name = self._full_name(index)
+        return GitHubRepo(
+            name=full_name.split("/", 1)[-1],
+            full_name=full_name,
+            description=None,
+            html_url=f"https://github.com/{full_name}",
+            stargazers_count=int(self._repo_stars[index]),
+        )
+
+    async def get_stargazers(
+        self,
+        user: str,
+        repo: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[GitHubUser]:
+        if since is not None or until is not None:
+            raise UnsupportedQueryError(
+                "The snapshot doesn't know when repos were starred"
+            )
+
+        index = self._find(self._repo_offsets, self._repo_blob, f"{user}/{repo}")
+        if index is None:
+            raise RepositoryNotFoundError(f"{user}/{repo} is not in the snapshot")
+
+        start, end = self._repo_indptr[index : index + 2]
+        return [
+            GitHubUser(login=self._login(int(i))) for i in self._repo_indices[start:end]
+        ]
+
+    async def get_starred_repos(self, user: str) -> list[GitHubRepo]:
+        index = self._find(self._user_offsets, self._user_blob, user)
+        if index is None:
+            return []
+
+        start, end = self._user_indptr[index : index + 2]
+        return [self._repo(int(i)) for i in self._user_indices[start:end]]
+
+    async def get_starred_repos_count(self, user: str) -> int:
+        index = self._find(self._user_offsets, self._user_blob, user)
+        if index is None:
+            return 0
+
+        start, end = self._user_indptr[index : index + 2]
+        return int(end - start)
+
+    @classmethod
+    def create(
+        cls, path: Path | str, starred_repos: Mapping[str, Sequence[GitHubRepo]]
+    ) -> None:
+        """Write a snapshot of the stars of some users.
+
+        Args:
+            path: where to write the snapshot, replaced atomically
+            starred_repos: repos starred by each login, e.g. from a crawl
+        """
+        logins = sorted(starred_repos, key=str.encode)
+        stars: dict[str, int] = {}
+        for repos in starred_repos.values():
+            for repo in repos:
+                stars[repo.full_name] = max(
+                    stars.get(repo.full_name, 0), repo.stargazers_count
+                )
+        full_names = sorted(stars, key=str.encode)
+        repo_index = {full_name: i for i, full_name in enumerate(full_names)}
+
+        rows = np.repeat(
+            np.arange(len(logins)), [len(starred_repos[login]) for login in logins]
+        )
+        cols = np.array(
+            [
+                repo_index[repo.full_name]
+                for login in logins
+                for repo in starred_repos[login]
+            ],
+            dtype=np.int64,
+        )
+        by_user = coo_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+            shape=(len(logins), len(full_names)),
+        ).tocsr()
+        by_user.sum_duplicates()
+        by_repo = by_user.tocsc()
+
+        user_offsets, user_blob = _string_table(logins)
+        repo_offsets, repo_blob = _string_table(full_names)
+        sections: list[bytes] = [
+            cls.HEADER.pack(
+                cls.MAGIC, cls.VERSION, len(logins), len(full_names), by_user.nnz
+            ),
+            user_offsets.tobytes(),
+            repo_offsets.tobytes(),
+            np.array([stars[n] for n in full_names], dtype=np.int64).tobytes(),
+            by_user.indptr.astype(np.uint64).tobytes(),
+            by_user.indices.astype(np.uint32).tobytes(),
+            by_repo.indptr.astype(np.uint64).tobytes(),
+            by_repo.indices.astype(np.uint32).tobytes(),
+            user_blob,
+            repo_blob,
+        ]
+
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "wb") as f:
+            for section in sections:
+                f.write(section)
+                f.write(b"\0" * (_aligned(len(section)) - len(section)))
+        os.replace(tmp_path, path)
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def _string_table(names: list[str]) -> tuple[npt.NDArray[np.uint64], bytes]:
+    encoded = [name.encode() for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
@@ -15,6 +15,13 @@ class SQLiteAPITokenRepository(APITokenRepository):
     """SQLite implementation of the API token repository."""
 
     DB_PATH = Path("data/api_tokens.db")
+    # Columns added after the table was first released, with their definition
+    ADDED_COLUMNS = {
+        "cache_max_age": "INTEGER NOT NULL DEFAULT 300",
+        "weight": "REAL NOT NULL DEFAULT 1",
+        "max_concurrency": "INTEGER NOT NULL DEFAULT 4",
+        "hourly_quota": "INTEGER",
+    }
 
     def __init__(self) -> None:
         """Initialize the database if it doesn't exist."""
@@ -28,9 +35,20 @@ class SQLiteAPITokenRepository(APITokenRepository):
                     hashed_token TEXT NOT NULL UNIQUE,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    comments TEXT
+                    comments TEXT,
+                    cache_max_age INTEGER NOT NULL DEFAULT 300,
+                    weight REAL NOT NULL DEFAULT 1,
+                    max_concurrency INTEGER NOT NULL DEFAULT 4,
+                    hourly_quota INTEGER
                 )
             """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(api_tokens)")}
+            # Databases created before the columns were added
+            for column, definition in self.ADDED_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(
+                        f"ALTER TABLE api_tokens ADD COLUMN {column} {definition}"
+                    )
             conn.commit()
 
     def get_by_token(self, token: str) -> Optional[APIToken]:
@@ -41,7 +59,8 @@ class SQLiteAPITokenRepository(APITokenRepository):
             cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT id, name, hashed_token, created_at, updated_at, comments
+                SELECT id, name, hashed_token, created_at, updated_at, comments,
+                       cache_max_age, weight, max_concurrency, hourly_quota
                 FROM api_tokens
                 WHERE hashed_token = ?
                 """,
@@ -59,21 +78,69 @@ class SQLiteAPITokenRepository(APITokenRepository):
                 created_at=datetime.fromisoformat(row[3]),
                 updated_at=datetime.fromisoformat(row[4]),
                 comments=row[5],
+                cache_max_age=row[6],
+                weight=row[7],
+                max_concurrency=row[8],
+                hourly_quota=row[9],
             )
 
-    def create(self, token_name: str, token: str, comments: str = "") -> str:
-        """Create a new API token."""
+    def create(
+        self,
+        token_name: str,
+        token: str,
+        comments: str = "",
+        cache_max_age: int = 300,
+        weight: float = 1.0,
+        max_concurrency: int = 4,
+        hourly_quota: int | None = None,
+    ) -> str:
+        """Create a new API token.
+
+        `cache_max_age` is how long, in seconds, the responses served to this
+        token stay fresh. `weight`, `max_concurrency` and `hourly_quota` set
+        its share of the GitHub quota, see `APIToken`.
+
+        Raises:
+            ValueError: If a setting is out of its range, e.g. a weight of 0
+        """
         hashed_token = hashlib.sha256(token.encode()).hexdigest()
-        now = datetime.now(tz=timezone.utc).isoformat()
+        created_at = datetime.now(tz=timezone.utc)
+        now = created_at.isoformat()
+        # The same checks as when the token is read, or it would be unusable
+        APIToken(
+            id=0,
+            name=token_name,
+            hashed_token=hashed_token,
+            created_at=created_at,
+            updated_at=created_at,
+            comments=comments,
+            cache_max_age=cache_max_age,
+            weight=weight,
+            max_concurrency=max_concurrency,
+            hourly_quota=hourly_quota,
+        )
 
         with sqlite3.connect(self.DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO api_tokens (name, hashed_token, created_at, updated_at, comments)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO api_tokens (
+                    name, hashed_token, created_at, updated_at, comments,
+                    cache_max_age, weight, max_concurrency, hourly_quota
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (token_name, hashed_token, now, now, comments),
+                (
+                    token_name,
+                    hashed_token,
+                    now,
+                    now,
+                    comments,
+                    cache_max_age,
+                    weight,
+                    max_concurrency,
+                    hourly_quota,
+                ),
             )
             conn.commit()
         return hashed_token
@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from ..models.cache import CachedResponse, ResponseCacheRepository
+from .sqlite_api_token import SQLiteAPITokenRepository
+
+
+class SQLiteResponseCacheRepository(ResponseCacheRepository):
+    """Pinned responses in a SQLite database, shared by the worker processes.
+
+    The watchlist pins its responses here from the one worker that refreshes
+    them, and every worker reads them. Responses are never evicted, but those
+    whose pin has expired are removed when another one is cached.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None) -> None:
+        """Initialize the database if it doesn't exist.
+
+        Args:
+            db_path: Path of the database, the one of the API tokens if not set
+        """
+        self.db_path = db_path or SQLiteAPITokenRepository.DB_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pinned_responses (
+                    key TEXT PRIMARY KEY,
+                    content BLOB NOT NULL,
+                    etag TEXT NOT NULL,
+                    fetched_at TIMESTAMP NOT NULL,
+                    headers TEXT NOT NULL,
+                    pinned_until TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                """
+                SELECT content, etag, fetched_at, headers, pinned_until
+                FROM pinned_responses
+                WHERE key = ?
+                """,
+                (key,),
+            ).fetchone()
+
+        if not row:
+            return None
+        return CachedResponse(
+            content=row[0],
+            etag=row[1],
+            fetched_at=datetime.fromisoformat(row[2]),
+            headers=json.loads(row[3]),
+            pinned_until=None if row[4] is None else datetime.fromisoformat(row[4]),
+        )
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            # E.g. repositories no longer in the watchlist
+            conn.execute(
+                "DELETE FROM pinned_responses WHERE pinned_until < ?",
+                (datetime.now(tz=timezone.utc).isoformat(),),
+            )
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO pinned_responses (
+                    key, content, etag, fetched_at, headers, pinned_until
+                )
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    response.content,
+                    response.etag,
+                    response.fetched_at.isoformat(),
+                    json.dumps(response.headers),
+                    None
+                    if response.pinned_until is None
+                    else response.pinned_until.isoformat(),
+                ),
+            )
+            conn.commit()
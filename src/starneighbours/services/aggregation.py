@@ -0,0 +1,393 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import heapq
+import itertools
+import os
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from array import array
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import IO, Any, Final, Generic, Iterable, Iterator, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+from ..models.github import GitHubRepo, SortKey
+from .similarity import incidence_matrix_create, similarity_get
+
+# (full name, discovery rank of the edge, stargazers_count, stargazer index)
+_Edge = tuple[str, int, int, int]
+# (-score, discovery rank, offset of the group in its file)
+_Key = tuple[float, int, int]
+
+R = TypeVar("R", bound=tuple[Any, ...])
+
+
+@dataclass
+class Group:
+    """A starred repo, and the stargazers of the crawl who starred it."""
+
+    repo: str
+    # Indices of the stargazers, in increasing order
+    rows: npt.NDArray[np.int32]
+    # Similarity with the target, if the groups are sorted
+    score: float | None = None
+
+
+class Aggregator(ABC):
+    """Group the (stargazer, starred repo) pairs of a crawl by starred repo."""
+
+    @abstractmethod
+    def add(self, stargazer: int, starred_repo: GitHubRepo) -> None:
+        """Add a pair, `stargazer` being the index of the stargazer.
+
+        Pairs are added in crawl order, stargazer after stargazer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def groups(self, n_stargazers: int, sort: SortKey | None = None) -> Iterator[Group]:
+        """Group all the pairs added so far, one group at a time.
+
+        Args:
+            n_stargazers: number of stargazers crawled
+            sort: if set, groups are scored with this similarity and come
+                from the closest to the farthest. Otherwise, they come in
+                discovery order, without score. Ties keep the discovery order.
+        """
+        raise NotImplementedError
+
+
+class InMemoryAggregator(Aggregator):
+    def __init__(self) -> None:
+        self._rows = array("I")
+        self._cols = array("I")
+        self._repo_index: dict[str, int] = {}
+        self._repo_stars = array("q")
+
+    def add(self, stargazer: int, starred_repo: GitHubRepo) -> None:
+        col = self._repo_index.setdefault(starred_repo.full_name, len(self._repo_index))
+        if col == len(self._repo_stars):
+            self._repo_stars.append(starred_repo.stargazers_count)
+        self._rows.append(stargazer)
+        self._cols.append(col)
+
+    def groups(self, n_stargazers: int, sort: SortKey | None = None) -> Iterator[Group]:
+        repos = list(self._repo_index)
+        matrix = incidence_matrix_create(
+            self._rows, self._cols, (n_stargazers, len(repos))
+        )
+        if sort is None:
+            order = np.arange(len(repos))
+            scores = None
+        else:
+            scores = similarity_get(
+                sort,
+                np.diff(matrix.indptr).astype(np.int64),
+                np.asarray(self._repo_stars, dtype=np.int64),
+                n_stargazers,
+            )
+            # Stable, so ties keep the discovery order
+            order = np.argsort(-scores, kind="stable")
+
+        for col in order:
+            yield Group(
+                repo=repos[col],
+                rows=matrix.indices[matrix.indptr[col] : matrix.indptr[col + 1]],
+                score=None if scores is None else float(scores[col]),
+            )
+
+
+class _Runs(ABC, Generic[R]):
+    """Sorted runs of records, appended to a single temporary file.
+
+    The runs are merged at most `max_fan_in` at a time, each read through a
+    buffer of `READ_SIZE` bytes: whatever the number of runs, a single file is
+    open and the merge needs a bounded amount of memory.
+    """
+
+    READ_SIZE: Final[int] = 64 * 1024
+
+    def __init__(self, directory: str | None, max_fan_in: int) -> None:
+        self.directory = directory
+        self.max_fan_in = max_fan_in
+        self._file: IO[bytes] | None = None
+        # (start, end) offsets of the runs in the file
+        self._runs: list[tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def append(self, records: Iterable[R]) -> None:
+        """Append a run of records, already sorted."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.directory)
+        self._runs.append(self._write(self._file, records))
+
+    def merge(self, *sorted_records: Iterable[R]) -> Iterator[R]:
+        """Merge the runs, and records kept in memory, already sorted.
+
+        The file is closed once the merged records are all read.
+        """
+        file, runs = self._file, self._runs
+        self._file, self._runs = None, []
+        if file is None:
+            return iter(heapq.merge(*sorted_records))
+
+        while len(runs) > self.max_fan_in:
+            merged = tempfile.TemporaryFile(dir=self.directory)
+            merged_runs = []
+            for i in range(0, len(runs), self.max_fan_in):
+                records = heapq.merge(
+                    *(self._read(file, *run) for run in runs[i : i + self.max_fan_in])
+                )
+                merged_runs.append(self._write(merged, records))
+            file.close()
+            file, runs = merged, merged_runs
+
+        return self._read_and_close(
+            file,
+            heapq.merge(*(self._read(file, *run) for run in runs), *sorted_records),
+        )
+
+    def _write(self, file: IO[bytes], records: Iterable[R]) -> tuple[int, int]:
+        start = file.seek(0, os.SEEK_END)
+        file.writelines(self._encode(records))
+        return start, file.tell()
+
+    def _read(self, file: IO[bytes], start: int, end: int) -> Iterator[R]:
+        # Runs share the file, so each one seeks to where it stopped reading
+        rest = b""
+        while start < end:
+            file.seek(start)
+            chunk = file.read(min(self.READ_SIZE, end - start))
+            start += len(chunk)
+            records, rest = self._decode(rest + chunk)
+            yield from records
+
+    @staticmethod
+    def _read_and_close(file: IO[bytes], records: Iterable[R]) -> Iterator[R]:
+        with file:
+            yield from records
+
+    @abstractmethod
+    def _encode(self, records: Iterable[R]) -> Iterable[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _decode(self, data: bytes) -> tuple[list[R], bytes]:
+        """Decode the records in `data`, and return the bytes left over."""
+        raise NotImplementedError
+
+
+class _EdgeRuns(_Runs[_Edge]):
+    def _encode(self, records: Iterable[_Edge]) -> Iterable[bytes]:
+        # GitHub names can't contain tabs nor newlines
+        return (f"{n}\t{rank}\t{s}\t{row}\n".encode() for n, rank, s, row in records)
+
+    def _decode(self, data: bytes) -> tuple[list[_Edge], bytes]:
+        *lines, rest = data.split(b"\n")
+        edges = []
+        for line in lines:
+            name, rank, stars, row = line.split(b"\t")
+            edges.append((name.decode(), int(rank), int(stars), int(row)))
+        return edges, rest
+
+
+class _KeyRuns(_Runs[_Key]):
+    KEY: Final[struct.Struct] = struct.Struct("<dqq")
+
+    def _encode(self, records: Iterable[_Key]) -> Iterable[bytes]:
+        return (self.KEY.pack(*key) for key in records)
+
+    def _decode(self, data: bytes) -> tuple[list[_Key], bytes]:
+        end = len(data) - len(data) % self.KEY.size
+        return list(self.KEY.iter_unpack(data[:end])), data[end:]
+
+
+class SpillingAggregator(Aggregator):
+    """Keep the pairs in memory up to a budget, then on disk.
+
+    The pairs are kept in arrays, with the name of each repo once. Past the
+    budget, they are sorted by repo and appended as a run to a temporary
+    file. At the end, the runs are merged and each group is written to
+    another temporary file, while only its sort key stays in memory, up to
+    the budget too. The groups are then read back one at a time, in order:
+    whatever the size of the crawl, the memory used stays around the budget,
+    plus the largest group. It gives the same groups as `InMemoryAggregator`.
+    """
+
+    # Rough size of a pair in memory: its repo, rank and stargazer
+    EDGE_SIZE: Final[int] = 16
+    # Rough size of a repo in memory, on top of its full name
+    REPO_SIZE: Final[int] = 150
+    # Size of the sort key of a group in memory
+    KEY_SIZE: Final[int] = _KeyRuns.KEY.size
+    # Groups scored at once
+    SCORE_BATCH: Final[int] = 4096
+    # Number of stargazers and length of the name of a group in its file
+    GROUP_HEADER: Final[struct.Struct] = struct.Struct("<II")
+    MAX_FAN_IN: Final[int] = 64
+
+    def __init__(
+        self,
+        memory_budget: int,
+        directory: str | None = None,
+        max_fan_in: int = MAX_FAN_IN,
+    ) -> None:
+        if max_fan_in < 2:
+            raise ValueError("At least 2 runs must be merged at a time")
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.max_fan_in = max_fan_in
+        self._runs = _EdgeRuns(directory, max_fan_in)
+        self._clear()
+        self._spilled = 0
+        self._rank = 0
+
+    @property
+    def spilled(self) -> int:
+        """Number of times the pairs were written to disk."""
+        return self._spilled
+
+    def add(self, stargazer: int, starred_repo: GitHubRepo) -> None:
+        name = starred_repo.full_name
+        col = self._repo_index.setdefault(name, len(self._repo_index))
+        if col == len(self._repo_stars):
+            # Like in memory, keep what was seen first
+            self._repo_stars.append(starred_repo.stargazers_count)
+            self._buffer_size += self.REPO_SIZE + len(name)
+        self._cols.append(col)
+        self._ranks.append(self._rank)
+        self._rows.append(stargazer)
+        self._rank += 1
+        self._buffer_size += self.EDGE_SIZE
+        if self._buffer_size > self.memory_budget:
+            self._spill()
+
+    def _clear(self) -> None:
+        self._repo_index: dict[str, int] = {}
+        self._repo_stars = array("q")
+        self._cols = array("I")
+        self._ranks = array("q")
+        self._rows = array("I")
+        self._buffer_size = 0
+
+    def _spill(self) -> None:
+        self._runs.append(self._sorted_buffer())
+        self._spilled += 1
+        self._clear()
+
+    def _sorted_buffer(self) -> Iterator[_Edge]:
+        names = list(self._repo_index)
+        by_name = np.empty(len(names), dtype=np.int64)
+        by_name[sorted(range(len(names)), key=names.__getitem__)] = np.arange(
+            len(names)
+        )
+        order = np.lexsort(
+            (
+                np.frombuffer(self._ranks, dtype=np.int64),
+                by_name[np.frombuffer(self._cols, dtype=np.uint32)],
+            )
+        )
+        cols, ranks, rows, stars = self._cols, self._ranks, self._rows, self._repo_stars
+        for i in order.tolist():
+            col = cols[i]
+            yield names[col], ranks[i], stars[col], rows[i]
+
+    def groups(self, n_stargazers: int, sort: SortKey | None = None) -> Iterator[Group]:
+        if len(self._runs):
+            # The pairs kept in memory would otherwise add to the keys
+            self._spill()
+            edges = self._runs.merge()
+        else:
+            edges = self._sorted_buffer()
+
+        with tempfile.TemporaryFile(dir=self.directory) as groups_file:
+            keys = self._sorted_keys(edges, groups_file, n_stargazers, sort)
+            self._clear()
+            for score, _, offset in keys:
+                groups_file.seek(offset)
+                n_rows, name_size = self.GROUP_HEADER.unpack(
+                    groups_file.read(self.GROUP_HEADER.size)
+                )
+                name = groups_file.read(name_size).decode()
+                yield Group(
+                    repo=name,
+                    rows=np.frombuffer(groups_file.read(4 * n_rows), dtype=np.int32),
+                    score=None if sort is None else -score,
+                )
+
+    def _sorted_keys(
+        self,
+        edges: Iterator[_Edge],
+        groups_file: IO[bytes],
+        n_stargazers: int,
+        sort: SortKey | None,
+    ) -> Iterator[_Key]:
+        """Write the groups to `groups_file`, and sort their keys."""
+        key_runs = _KeyRuns(self.directory, self.max_fan_in)
+        keys = (array("d"), array("q"), array("q"))
+        # (discovery rank, offset, stargazers in common, stargazers_count)
+        batch: list[tuple[int, int, int, int]] = []
+
+        def score_batch() -> None:
+            if sort is None:
+                scores = np.zeros(len(batch))
+            else:
+                scores = similarity_get(
+                    sort,
+                    np.array([shared for _, _, shared, _ in batch], dtype=np.int64),
+                    np.array([stars for _, _, _, stars in batch], dtype=np.int64),
+                    n_stargazers,
+                )
+            keys[0].extend((-scores).tolist())
+            keys[1].extend(rank for rank, _, _, _ in batch)
+            keys[2].extend(offset for _, offset, _, _ in batch)
+            batch.clear()
+            if len(keys[0]) * self.KEY_SIZE > self.memory_budget:
+                key_runs.append(self._sorted(keys))
+                for field in keys:
+                    del field[:]
+
+        for name, repo_edges in itertools.groupby(edges, key=itemgetter(0)):
+            rows = array("i")
+            for _, edge_rank, edge_stars, row in repo_edges:
+                if not rows:
+                    rank, stars = edge_rank, edge_stars
+                    rows.append(row)
+                elif row != rows[-1]:
+                    # Edges are sorted by rank, so by stargazer
+                    rows.append(row)
+            encoded = name.encode()
+            offset = groups_file.tell()
+            groups_file.write(self.GROUP_HEADER.pack(len(rows), len(encoded)))
+            groups_file.write(encoded)
+            groups_file.write(rows.tobytes())
+            batch.append((rank, offset, len(rows), stars))
+            if len(batch) == self.SCORE_BATCH:
+                score_batch()
+        score_batch()
+
+        return key_runs.merge(self._sorted(keys))
+
+    @staticmethod
+    def _sorted(keys: tuple[array[float], array[int], array[int]]) -> Iterator[_Key]:
+        # Ranks are unique, so the offsets never break a tie
+        scores, ranks, offsets = keys
+        order = np.lexsort(
+            (np.frombuffer(ranks, dtype=np.int64), np.frombuffer(scores))
+        )
+        for i in order.tolist():
+            yield scores[i], ranks[i], offsets[i]
+
+
+def aggregator_create(memory_budget: int | None = None) -> Aggregator:
+    """Create an aggregator that spills to disk past `memory_budget` bytes."""
+    if memory_budget is None:
+        return InMemoryAggregator()
+    return SpillingAggregator(memory_budget)
@@ -0,0 +1,60 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import heapq
+
+
+class SpaceSaving:
+    """Approximate the most frequent items of a stream in fixed memory.
+
+    Space-Saving (Metwally et al., 2005) keeps `capacity` counters. An item
+    that isn't counted yet replaces the smallest counter, and inherits its
+    count as error. So for a counted item, the true count is between
+    `count - error` and `count`, and every item seen more than
+    `total / capacity` times is counted.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        # item -> (count, error)
+        self._counters: dict[str, tuple[int, int]] = {}
+        # (count, item), with a count that may be lower than the real one:
+        # entries aren't updated on increments, but when they are popped
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, item: str) -> None:
+        self.total += 1
+        counter = self._counters.get(item)
+        if counter is not None:
+            count, error = counter
+            self._counters[item] = (count + 1, error)
+            return
+
+        if len(self._counters) < self.capacity:
+            self._counters[item] = (1, 0)
+            heapq.heappush(self._heap, (1, item))
+            return
+
+        # Evict the smallest counter
+        while True:
+            count, evicted = heapq.heappop(self._heap)
+            current, _ = self._counters[evicted]
+            if current == count:
+                break
+            heapq.heappush(self._heap, (current, evicted))
+        del self._counters[evicted]
+        self._counters[item] = (count + 1, count)
+        heapq.heappush(self._heap, (count + 1, item))
+
+    def top(self, k: int) -> list[tuple[str, int, int]]:
+        """The `k` items with the highest counts, as (item, count, error)."""
+        return [
+            (item, count, error)
+            for item, (count, error) in heapq.nlargest(
+                k, self._counters.items(), key=lambda counter: counter[1][0]
+            )
+        ]
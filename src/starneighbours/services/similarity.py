@@ -0,0 +1,75 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from typing import Final, Sequence
+
+import numpy as np
+import numpy.typing as npt
+from scipy.sparse import coo_matrix, csc_matrix
+
+from ..models.github import SortKey
+
+# Rough number of GitHub accounts, used as the population size for the lift.
+# It only scales the scores: the ranking does not depend on it.
+GITHUB_USERS: Final[int] = 100_000_000
+
+
+def incidence_matrix_create(
+    rows: Sequence[int], cols: Sequence[int], shape: tuple[int, int]
+) -> csc_matrix:
+    """Build the binary stargazers x starred repos matrix.
+
+    Args:
+        rows: stargazer index of each (stargazer, repo) edge
+        cols: repo index of each (stargazer, repo) edge
+        shape: (number of stargazers, number of repos)
+
+    Returns:
+        A CSC matrix, so that the stargazers of a repo are a contiguous slice
+        of `indices`. Duplicated edges (e.g. a page shifted during the crawl)
+        are counted once.
+    """
+    matrix = coo_matrix(
+        (
+            np.ones(len(rows), dtype=np.int32),
+            (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32)),
+        ),
+        shape=shape,
+    ).tocsc()
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def similarity_get(
+    metric: SortKey,
+    shared: npt.NDArray[np.int64],
+    neighbour_stars: npt.NDArray[np.int64],
+    target_stars: int,
+) -> npt.NDArray[np.float64]:
+    """Compute the similarity between the target and each neighbour.
+
+    Args:
+        metric: the similarity to compute
+        shared: number of stargazers in common, per neighbour
+        neighbour_stars: `stargazers_count` of each neighbour
+        target_stars: number of stargazers of the target
+
+    Returns:
+        One score per neighbour, higher is closer.
+    """
+    shared_f = shared.astype(np.float64)
+    # stargazers_count may be stale, it can't be lower than what we've seen
+    neighbour_f = np.maximum(neighbour_stars, shared).astype(np.float64)
+    target_f = float(max(target_stars, 1))
+
+    if metric == SortKey.SHARED:
+        return shared_f
+    if metric == SortKey.JACCARD:
+        return shared_f / np.maximum(target_f + neighbour_f - shared_f, 1.0)
+    if metric == SortKey.COSINE:
+        return shared_f / np.sqrt(target_f * np.maximum(neighbour_f, 1.0))
+    if metric == SortKey.LIFT:
+        return shared_f * GITHUB_USERS / (target_f * np.maximum(neighbour_f, 1.0))
+    raise ValueError(f"Unknown similarity metric: {metric}")
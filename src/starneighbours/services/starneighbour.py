@@ -2,21 +2,105 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from collections import defaultdict
-from typing import List
-from ..models.github import GitHubRepository, StarNeighbour
+from typing import AsyncIterator, Final, Iterator, List, Optional
+
+from ..models.github import (
+    CrawlPlan,
+    CrawlPolicy,
+    GitHubRepo,
+    GitHubRepository,
+    GitHubUser,
+    SortKey,
+    StarNeighbour,
+)
+from .aggregation import aggregator_create
+from .heavy_hitters import SpaceSaving
 
 
 class StarNeighbourService:
-    def __init__(self, github_repo: GitHubRepository):
+    # Counters of the sketch used to find the top neighbours, per neighbour
+    # asked, and at least
+    TOP_SKETCH_FACTOR: Final[int] = 10
+    TOP_SKETCH_MIN: Final[int] = 1024
+
+    def __init__(
+        self, github_repo: GitHubRepository, memory_budget: Optional[int] = None
+    ):
+        """
+        Args:
+            github_repo: Where the stars come from
+            memory_budget: Approximate size, in bytes, of the crawl kept in
+                memory before spilling it to disk. Unbounded if not set.
+        """
         self.github_repo = github_repo
+        self.memory_budget = memory_budget
+
+    async def plan_crawl(
+        self, user: str, repo: str, policy: Optional[CrawlPolicy] = None
+    ) -> CrawlPlan:
+        """Choose which stargazers of the given repository to crawl.
+
+        When the policy needs it, the number of repos starred by each
+        stargazer is probed first, which costs one request per stargazer.
+
+        Args:
+            user: GitHub username
+            repo: Repository name
+            policy: How to order, cap or skip stargazers. Everyone is
+                crawled if not set.
+
+        Returns:
+            The stargazers to crawl, in order, and the skipped ones
 
-    async def find_neighbours(self, user: str, repo: str) -> List[StarNeighbour]:
+        Raises:
+            GitHubAPIError: If the GitHub API returns an error
+            RateLimitError: If we hit the GitHub API rate limit
+        """
+        if policy is None:
+            policy = CrawlPolicy()
+        stargazers = await self.github_repo.get_stargazers(
+            user, repo, since=policy.since, until=policy.until
+        )
+        if not policy.needs_probe:
+            return CrawlPlan(stargazers=stargazers)
+
+        candidates = [
+            (stargazer, await self.github_repo.get_starred_repos_count(stargazer.login))
+            for stargazer in stargazers
+        ]
+        if policy.cheapest_first:
+            candidates.sort(key=lambda candidate: candidate[1])
+
+        plan = CrawlPlan(stargazers=[])
+        spent = 0
+        for stargazer, cost in candidates:
+            if (policy.max_starred is not None and cost > policy.max_starred) or (
+                policy.budget is not None and spent + cost > policy.budget
+            ):
+                plan.skipped.append(stargazer)
+                continue
+            spent += cost
+            plan.stargazers.append(stargazer)
+
+        return plan
+
+    async def find_neighbours(
+        self,
+        user: str,
+        repo: str,
+        sort: Optional[SortKey] = None,
+        plan: Optional[CrawlPlan] = None,
+    ) -> List[StarNeighbour]:
         """Find repositories that share stargazers with the given repository.
 
         Args:
             user: GitHub username
             repo: Repository name
+            sort: If set, neighbours are scored with this similarity and
+                sorted from the closest to the farthest. Otherwise, they are
+                returned in discovery order, without score.
+            plan: Stargazers to crawl, see `plan_crawl`. All the stargazers
+                are crawled if not set.
 
         Returns:
             List of StarNeighbour objects containing repositories and their common stargazers
@@ -25,20 +109,117 @@ class StarNeighbourService:
             GitHubAPIError: If the GitHub API returns an error
             RateLimitError: If we hit the GitHub API rate limit
         """
+        return list(await self.iter_neighbours(user, repo, sort=sort, plan=plan))
 
-        target_stargazers = await self.github_repo.get_stargazers(user, repo)
+    async def iter_neighbours(
+        self,
+        user: str,
+        repo: str,
+        sort: Optional[SortKey] = None,
+        plan: Optional[CrawlPlan] = None,
+    ) -> Iterator[StarNeighbour]:
+        """Like `find_neighbours`, but build the neighbours one at a time.
 
-        repo_to_stargazers = defaultdict(list)
+        With a memory budget, the neighbours are never all in memory: they
+        are read back from disk while iterated. See `find_neighbours` for the
+        arguments.
 
-        for stargazer in target_stargazers:
+        Raises:
+            GitHubAPIError: If the GitHub API returns an error
+            RateLimitError: If we hit the GitHub API rate limit
+        """
+        if plan is None:
+            plan = await self.plan_crawl(user, repo)
+        target_stargazers = plan.stargazers
+
+        aggregator = aggregator_create(self.memory_budget)
+        async for row, starred_repo in self._starred_repos(
+            user, repo, target_stargazers
+        ):
+            aggregator.add(row, starred_repo)
+
+        return (
+            StarNeighbour(
+                repo=group.repo,
+                stargazers=[target_stargazers[row] for row in group.rows.tolist()],
+                score=group.score,
+            )
+            for group in aggregator.groups(len(target_stargazers), sort)
+        )
+
+    async def find_top_neighbours(
+        self,
+        user: str,
+        repo: str,
+        k: int,
+        plan: Optional[CrawlPlan] = None,
+        exact: bool = False,
+    ) -> List[StarNeighbour]:
+        """Find the repositories that share the most stargazers with the given one.
+
+        Unlike `find_neighbours`, the memory used doesn't depend on the number
+        of neighbours: the stars go through a Space-Saving sketch. The score
+        of a neighbour is its estimated number of stargazers in common, the
+        real one being between `score - error` and `score`. Stargazers in
+        common are unknown, so left empty.
+
+        Args:
+            user: GitHub username
+            repo: Repository name
+            k: Number of neighbours to return
+            plan: Stargazers to crawl, see `plan_crawl`. All the stargazers
+                are crawled if not set.
+            exact: Crawl a second time to get the exact number of stargazers
+                in common, and the stargazers, of the top neighbours only.
+                Cheap if the starred repos of the first crawl are cached.
+
+        Returns:
+            At most `k` StarNeighbour objects, sorted by score
+
+        Raises:
+            GitHubAPIError: If the GitHub API returns an error
+            RateLimitError: If we hit the GitHub API rate limit
+        """
+        if plan is None:
+            plan = await self.plan_crawl(user, repo)
+
+        sketch = SpaceSaving(max(k * self.TOP_SKETCH_FACTOR, self.TOP_SKETCH_MIN))
+        async for _, starred_repo in self._starred_repos(user, repo, plan.stargazers):
+            sketch.add(starred_repo.full_name)
+        winners = sketch.top(k)
+
+        if not exact:
+            return [
+                StarNeighbour(repo=name, stargazers=[], score=float(count), error=error)
+                for name, count, error in winners
+            ]
+
+        common: dict[str, list[GitHubUser]] = {name: [] for name, _, _ in winners}
+        async for row, starred_repo in self._starred_repos(user, repo, plan.stargazers):
+            stargazers = common.get(starred_repo.full_name)
+            stargazer = plan.stargazers[row]
+            # A repo can be listed twice if a page shifted during the crawl
+            if stargazers is not None and (
+                not stargazers or stargazers[-1] is not stargazer
+            ):
+                stargazers.append(stargazer)
+
+        neighbours = [
+            StarNeighbour(
+                repo=name, stargazers=stargazers, score=float(len(stargazers)), error=0
+            )
+            for name, stargazers in common.items()
+        ]
+        neighbours.sort(key=lambda neighbour: -len(neighbour.stargazers))
+        return neighbours
+
+    async def _starred_repos(
+        self, user: str, repo: str, stargazers: List[GitHubUser]
+    ) -> AsyncIterator[tuple[int, GitHubRepo]]:
+        """Stream (stargazer index, starred repo) pairs, without the target."""
+        for row, stargazer in enumerate(stargazers):
             starred_repos = await self.github_repo.get_starred_repos(stargazer.login)
             for starred_repo in starred_repos:
                 # Don't include the target repository itself
                 if f"{user}/{repo}" != starred_repo.full_name:
-                    repo_to_stargazers[starred_repo.full_name].append(stargazer)
-
-        # Convert to StarNeighbour objects
-        return [
-            StarNeighbour(repo=starred_repo, stargazers=stargazers)
-            for starred_repo, stargazers in repo_to_stargazers.items()
-        ]
+                    yield row, starred_repo
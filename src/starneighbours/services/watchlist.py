@@ -0,0 +1,119 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Final
+
+from ..models.cache import (
+    ResponseCacheRepository,
+    neighbours_cache_key,
+    neighbours_response_create,
+)
+from ..models.github import CrawlPlan, QuotaExceededError, RateLimitError
+from .starneighbour import StarNeighbourService
+
+logger = logging.getLogger(__name__)
+
+
+class Watchlist:
+    """Keep the neighbours of the most requested repositories precomputed.
+
+    The neighbours of each target, with the default query parameters, are
+    computed one target at a time and pinned in the response cache: requests
+    for them are served from there, whatever their age, while the next
+    refresh is computed. If a target can't be refreshed for `PINNED_INTERVALS`
+    intervals, it is unpinned and expires like any other response.
+    """
+
+    REFRESH_INTERVAL: Final[timedelta] = timedelta(hours=6)
+    PINNED_INTERVALS: Final[int] = 3
+
+    def __init__(
+        self,
+        service_create: Callable[[], StarNeighbourService],
+        cache: ResponseCacheRepository,
+        targets: list[tuple[str, str]],
+        refresh_interval: timedelta = REFRESH_INTERVAL,
+    ) -> None:
+        """
+        Args:
+            service_create: creates the service that computes the neighbours,
+                once per refresh so that the age of its stars is per refresh
+            cache: cache the neighbours are pinned in
+            targets: `(owner, repo)` of the repositories to refresh
+            refresh_interval: how often each target is refreshed
+        """
+        self.service_create = service_create
+        self.cache = cache
+        self.targets = targets
+        self.refresh_interval = refresh_interval
+
+    async def refresh(self, user: str, repo: str) -> None:
+        """Compute the neighbours of a target again, and pin them in the cache.
+
+        Once the quota is exhausted, the refresh waits for it to reset, then
+        resumes: the stargazers to crawl are kept, and so are the starred
+        repos fetched so far, if the GitHub repository of the service caches
+        them for long enough (see `watchlist_create`). A target can then
+        need more than a quota window, but not more than `refresh_interval`.
+
+        Raises:
+            GitHubAPIError: If the GitHub API returns an error
+            RateLimitError: If the GitHub rate limit is exceeded, and resets
+                past `refresh_interval` after the start of the refresh
+            QuotaExceededError: If the quota of the watchlist is exceeded,
+                and resets past `refresh_interval` after the start of the
+                refresh
+        """
+        deadline = time.time() + self.refresh_interval.total_seconds()
+        service = self.service_create()
+        plan: CrawlPlan | None = None
+        while True:
+            try:
+                if plan is None:
+                    plan = await service.plan_crawl(user, repo)
+                neighbours = await service.iter_neighbours(user, repo, plan=plan)
+                break
+            except (QuotaExceededError, RateLimitError) as e:
+                if e.reset_time > deadline:
+                    raise
+                await asyncio.sleep(max(0.0, e.reset_time - time.time()))
+
+        self.cache.set(
+            neighbours_cache_key(user, repo),
+            neighbours_response_create(
+                neighbours,
+                plan.skipped,
+                pinned_for=self.refresh_interval * self.PINNED_INTERVALS,
+                fetched_at=service.github_repo.oldest_fetched_at,
+            ),
+        )
+
+    async def run(self) -> None:
+        """Refresh every target, then again every `refresh_interval`, forever.
+
+        Once the quota is exhausted, the refresh waits for it to reset. A
+        target that fails, e.g. because it needs more GitHub requests than
+        the quota allows in an interval, keeps its previous neighbours until
+        the next round.
+        """
+        while True:
+            started = datetime.now(tz=timezone.utc)
+            for user, repo in self.targets:
+                try:
+                    await self.refresh(user, repo)
+                except Exception:
+                    # Whatever the error, e.g. of the network, the other
+                    # targets are still refreshed
+                    logger.exception(
+                        "Could not refresh the neighbours of %s/%s", user, repo
+                    )
+
+            elapsed = datetime.now(tz=timezone.utc) - started
+            await asyncio.sleep(
+                max(0.0, (self.refresh_interval - elapsed).total_seconds())
+            )
@@ -1,8 +1,9 @@
 from pathlib import Path
-from typing import Iterator
+from typing import Callable, Iterator
 from starneighbours.main import app
 from fastapi.testclient import TestClient
 import pytest
+from starneighbours.models.github import GitHubRepo
 from starneighbours.repositories.sqlite_api_token import SQLiteAPITokenRepository
 
 
@@ -45,3 +46,19 @@ def logged_client_http(
 def client_http() -> Iterator[TestClient]:
     client = TestClient(app, headers={"Authorization": ""})
     yield client
+
+
+@pytest.fixture
+def repo_factory() -> Callable[..., GitHubRepo]:
+    """Create a starred repo from its full name."""
+
+    def create(full_name: str, stargazers_count: int = 1) -> GitHubRepo:
+        return GitHubRepo(
+            name=full_name.split("/")[1],
+            full_name=full_name,
+            description=None,
+            html_url=f"https://github.com/{full_name}",
+            stargazers_count=stargazers_count,
+        )
+
+    return create
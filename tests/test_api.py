@@ -2,18 +2,41 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+import asyncio
+import fcntl
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, patch, MagicMock
-from typing import Iterator
+from typing import Callable, Coroutine, Iterator
 from starneighbours.models.github import (
+    CrawlPlan,
+    CrawlPolicy,
+    GitHubRepo,
     GitHubUser,
+    SortKey,
     StarNeighbour,
     GitHubAPIError,
+    QuotaExceededError,
     RateLimitError,
 )
+from starneighbours.main import app
+from starneighbours.models.cache import neighbours_cache_key, neighbours_response_create
+from starneighbours.repositories.api import (
+    ClientDisconnectedError,
+    cancel_on_disconnect,
+    get_response_cache,
+    watchlist_create,
+)
+from starneighbours.repositories.cached_github import CachedGitHubRepository
+from starneighbours.repositories.memory_cache import InMemoryResponseCacheRepository
+from starneighbours.repositories.snapshot import SnapshotGitHubRepository
 from starneighbours.repositories.sqlite_api_token import SQLiteAPITokenRepository
+from starneighbours.repositories.sqlite_response_cache import (
+    SQLiteResponseCacheRepository,
+)
 
 
 @pytest.fixture
@@ -38,6 +61,15 @@ def test_token_repo(test_db_path: Path) -> SQLiteAPITokenRepository:
     return repo
 
 
+@pytest.fixture(autouse=True)
+def response_cache() -> Iterator[InMemoryResponseCacheRepository]:
+    """Don't share cached responses between tests."""
+    cache = InMemoryResponseCacheRepository()
+    app.dependency_overrides[get_response_cache] = lambda: cache
+    yield cache
+    del app.dependency_overrides[get_response_cache]
+
+
 @pytest.fixture
 def mock_github_repo() -> Iterator[MagicMock]:
     with patch("starneighbours.repositories.api.GitHubAPIRepository") as mock:
@@ -48,6 +80,8 @@ def mock_github_repo() -> Iterator[MagicMock]:
 def mock_starneighbour_service(mock_github_repo: MagicMock) -> Iterator[AsyncMock]:
     with patch("starneighbours.repositories.api.StarNeighbourService") as mock:
         service = AsyncMock()
+        service.memory_budget = None
+        service.plan_crawl.return_value = CrawlPlan(stargazers=[])
         mock.return_value = service
         yield service
 
@@ -55,7 +89,7 @@ def mock_starneighbour_service(mock_github_repo: MagicMock) -> Iterator[AsyncMoc
 def test_get_starneighbours_success(
     mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
 ) -> None:
-    mock_starneighbour_service.find_neighbours.return_value = [
+    mock_starneighbour_service.iter_neighbours.return_value = [
         StarNeighbour(
             repo="user1/repo1",
             stargazers=[GitHubUser(login="stargazer1"), GitHubUser(login="stargazer2")],
@@ -79,15 +113,151 @@ def test_get_starneighbours_success(
             "stargazers": [{"login": "stargazer1"}],
         },
     ]
-    mock_starneighbour_service.find_neighbours.assert_called_once_with(
-        "testuser", "testrepo"
+    mock_starneighbour_service.iter_neighbours.assert_called_once_with(
+        "testuser", "testrepo", sort=None, plan=CrawlPlan(stargazers=[])
     )
+    mock_starneighbour_service.plan_crawl.assert_called_once_with(
+        "testuser", "testrepo", CrawlPolicy()
+    )
+    assert "X-Skipped-Stargazers" not in response.headers
+    assert "X-Skipped-Stargazers-Count" not in response.headers
+
+
+def test_get_starneighbours_sort(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = [
+        StarNeighbour(
+            repo="user1/repo1",
+            stargazers=[GitHubUser(login="stargazer1")],
+            score=0.5,
+        ),
+    ]
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?sort=jaccard"
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"repo": "user1/repo1", "stargazers": [{"login": "stargazer1"}], "score": 0.5}
+    ]
+    mock_starneighbour_service.iter_neighbours.assert_called_once_with(
+        "testuser", "testrepo", sort=SortKey.JACCARD, plan=CrawlPlan(stargazers=[])
+    )
+
+
+def test_get_starneighbours_crawl_policy(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    plan = CrawlPlan(
+        stargazers=[GitHubUser(login="stargazer1")],
+        skipped=[GitHubUser(login="collector1"), GitHubUser(login="collector2")],
+    )
+    mock_starneighbour_service.plan_crawl.return_value = plan
+    mock_starneighbour_service.iter_neighbours.return_value = []
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours"
+        "?max_starred=1000&budget=5000&cheapest_first=true"
+    )
+
+    assert response.status_code == 200
+    assert response.headers["X-Skipped-Stargazers"] == "collector1,collector2"
+    assert response.headers["X-Skipped-Stargazers-Count"] == "2"
+    mock_starneighbour_service.plan_crawl.assert_called_once_with(
+        "testuser",
+        "testrepo",
+        CrawlPolicy(max_starred=1000, budget=5000, cheapest_first=True),
+    )
+    mock_starneighbour_service.iter_neighbours.assert_called_once_with(
+        "testuser", "testrepo", sort=None, plan=plan
+    )
+
+
+def test_get_starneighbours_many_skipped(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.plan_crawl.return_value = CrawlPlan(
+        stargazers=[],
+        skipped=[GitHubUser(login=f"collector{i}") for i in range(10_000)],
+    )
+    mock_starneighbour_service.iter_neighbours.return_value = []
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?max_starred=1000"
+    )
+
+    assert response.headers["X-Skipped-Stargazers-Count"] == "10000"
+    skipped = response.headers["X-Skipped-Stargazers"]
+    assert len(skipped) <= 2048
+    assert skipped.startswith("collector0,collector1,")
+    assert skipped.endswith(",...")
+
+
+def test_get_starneighbours_time_window(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = []
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours"
+        "?since=2025-01-01T00:00:00&until=2025-01-31T00:00:00%2B02:00"
+    )
+
+    assert response.status_code == 200
+    policy = mock_starneighbour_service.plan_crawl.call_args[0][2]
+    assert policy.since == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert policy.until == datetime(2025, 1, 30, 22, tzinfo=timezone.utc)
+
+
+def test_get_starneighbours_top(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.find_top_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[], score=42.0, error=3),
+    ]
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?top=10&exact=true"
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"repo": "user1/repo1", "stargazers": [], "score": 42.0, "error": 3}
+    ]
+    mock_starneighbour_service.find_top_neighbours.assert_called_once_with(
+        "testuser", "testrepo", 10, plan=CrawlPlan(stargazers=[]), exact=True
+    )
+    mock_starneighbour_service.iter_neighbours.assert_not_called()
+
+
+def test_get_starneighbours_top_sorted_by_similarity(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?top=10&sort=jaccard"
+    )
+
+    assert response.status_code == 422
+    mock_starneighbour_service.find_top_neighbours.assert_not_called()
+
+
+def test_get_starneighbours_invalid_sort(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?sort=unknown"
+    )
+
+    assert response.status_code == 422
+    mock_starneighbour_service.iter_neighbours.assert_not_called()
 
 
 def test_get_starneighbours_rate_limit(
     mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
 ) -> None:
-    mock_starneighbour_service.find_neighbours.side_effect = RateLimitError(1234567890)
+    mock_starneighbour_service.iter_neighbours.side_effect = RateLimitError(1234567890)
 
     response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
 
@@ -97,10 +267,46 @@ def test_get_starneighbours_rate_limit(
     }
 
 
+def test_get_starneighbours_quota_exceeded(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.side_effect = QuotaExceededError(
+        1234567890
+    )
+
+    response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.status_code == 429
+    assert response.json() == {
+        "detail": "API token quota exceeded. Reset at 1234567890"
+    }
+
+
+def test_get_quota(
+    test_token_repo: SQLiteAPITokenRepository,
+) -> None:
+    test_token_repo.create("batch", "batch-token", weight=0.5, hourly_quota=1000)
+    client = TestClient(app, headers={"Authorization": "Bearer batch-token"})
+
+    response = client.get("/api/v1/quota")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "name": "batch",
+        "weight": 0.5,
+        "used": 0,
+        "hourly_quota": 1000,
+        "share": 5000,
+        "reset_at": None,
+        "in_flight": 0,
+        "queued": 0,
+    }
+
+
 def test_get_starneighbours_api_error(
     mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
 ) -> None:
-    mock_starneighbour_service.find_neighbours.side_effect = GitHubAPIError()
+    mock_starneighbour_service.iter_neighbours.side_effect = GitHubAPIError()
 
     response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
 
@@ -108,6 +314,49 @@ def test_get_starneighbours_api_error(
     assert response.json() == {"detail": "Error fetching data from GitHub API"}
 
 
+@pytest.fixture
+def snapshot_path(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    repo_factory: Callable[..., GitHubRepo],
+) -> Path:
+    path = tmp_path / "stars.snapshot"
+    starred = [repo_factory("testuser/testrepo"), repo_factory("testuser/other")]
+    SnapshotGitHubRepository.create(path, {"stargazer1": starred})
+    monkeypatch.setenv("STARNEIGHBOURS_SNAPSHOT", str(path))
+    return path
+
+
+def test_get_starneighbours_snapshot(
+    snapshot_path: Path, logged_client_http: TestClient
+) -> None:
+    response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.status_code == 200
+    assert [n["repo"] for n in response.json()] == ["testuser/other"]
+
+
+def test_get_starneighbours_snapshot_time_window(
+    snapshot_path: Path, logged_client_http: TestClient
+) -> None:
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?since=2025-01-01T00:00:00Z"
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {
+        "detail": "The snapshot doesn't know when repos were starred"
+    }
+
+
+def test_get_starneighbours_snapshot_unknown_repo(
+    snapshot_path: Path, logged_client_http: TestClient
+) -> None:
+    response = logged_client_http.get("/api/v1/repos/testuser/unknown/starneighbours")
+
+    assert response.status_code == 404
+
+
 def test_get_starneighbours_unauthorized(client_http: TestClient) -> None:
     """Test that requests without a valid token are rejected."""
 
@@ -121,3 +370,335 @@ def test_get_starneighbours_unauthorized(client_http: TestClient) -> None:
     )
     assert response.status_code == 401
     assert response.json() == {"detail": "Invalid authentication credentials"}
+
+
+def test_get_starneighbours_cache_headers(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[GitHubUser(login="stargazer1")])
+    ]
+
+    response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"')
+    assert response.headers["Last-Modified"].endswith(" GMT")
+    assert response.headers["Cache-Control"] in (
+        "max-age=300, must-revalidate",
+        "max-age=299, must-revalidate",
+    )
+    assert response.headers["Vary"] == "Authorization"
+
+
+def test_get_starneighbours_as_old_as_cached_stars(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = []
+    fetched_at = datetime.now(tz=timezone.utc).replace(microsecond=0) - timedelta(
+        minutes=2
+    )
+    with patch("starneighbours.repositories.api.CachedGitHubRepository") as mock:
+        mock.return_value.oldest_fetched_at = fetched_at
+        response = logged_client_http.get(
+            "/api/v1/repos/testuser/testrepo/starneighbours"
+        )
+
+    # Starred repos cached by an earlier crawl make the response older
+    assert response.headers["Last-Modified"] == format_datetime(fetched_at, usegmt=True)
+    assert response.headers["Cache-Control"] in (
+        "max-age=180, must-revalidate",
+        "max-age=179, must-revalidate",
+    )
+    # Not older than the token accepts
+    assert mock.call_args.kwargs["max_age"] == timedelta(seconds=300)
+
+
+def test_get_starneighbours_cached(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[GitHubUser(login="stargazer1")])
+    ]
+
+    first = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+    second = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+    other = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours?sort=lift"
+    )
+
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert other.status_code == 200
+    # The second request was served from the cache
+    assert mock_starneighbour_service.iter_neighbours.call_count == 2
+
+
+def test_get_starneighbours_larger_than_memory_budget(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.memory_budget = 10
+    mock_starneighbour_service.iter_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[GitHubUser(login="stargazer1")])
+    ]
+
+    first = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+    second = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours",
+        headers={"If-None-Match": first.headers["ETag"]},
+    )
+
+    # Streamed from disk, and too large to be cached
+    assert first.status_code == 200
+    assert first.json() == [
+        {"repo": "user1/repo1", "stargazers": [{"login": "stargazer1"}]}
+    ]
+    assert second.status_code == 304
+    assert mock_starneighbour_service.iter_neighbours.call_count == 2
+
+
+def test_get_starneighbours_not_modified(
+    mock_starneighbour_service: AsyncMock, logged_client_http: TestClient
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[GitHubUser(login="stargazer1")])
+    ]
+    etag = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours"
+    ).headers["ETag"]
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours",
+        headers={"If-None-Match": f'"other", W/{etag}'},
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = logged_client_http.get(
+        "/api/v1/repos/testuser/testrepo/starneighbours",
+        headers={"If-None-Match": '"other"'},
+    )
+
+    assert response.status_code == 200
+
+
+def test_get_starneighbours_freshness_per_token(
+    mock_starneighbour_service: AsyncMock,
+    test_token_repo: SQLiteAPITokenRepository,
+) -> None:
+    test_token_repo.create("polling", "polling-token", cache_max_age=0)
+    client = TestClient(app, headers={"Authorization": "Bearer polling-token"})
+    mock_starneighbour_service.iter_neighbours.return_value = []
+
+    client.get("/api/v1/repos/testuser/testrepo/starneighbours")
+    response = client.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.headers["Cache-Control"] == "max-age=0, must-revalidate"
+    # Never fresh, so always computed again
+    assert mock_starneighbour_service.iter_neighbours.call_count == 2
+
+
+def test_get_starneighbours_pinned(
+    mock_starneighbour_service: AsyncMock,
+    test_token_repo: SQLiteAPITokenRepository,
+    response_cache: InMemoryResponseCacheRepository,
+) -> None:
+    test_token_repo.create("polling", "polling-token", cache_max_age=0)
+    client = TestClient(app, headers={"Authorization": "Bearer polling-token"})
+    pinned = neighbours_response_create([], [], pinned_for=timedelta(hours=1))
+    response_cache.set(neighbours_cache_key("testuser", "testrepo"), pinned)
+
+    response = client.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == pinned.etag
+    # Refreshed by the watchlist, so never computed by requests
+    mock_starneighbour_service.iter_neighbours.assert_not_called()
+
+
+def test_get_response_cache_reads_pinned_responses(
+    test_token_repo: SQLiteAPITokenRepository,
+) -> None:
+    pinned = neighbours_response_create([], [], pinned_for=timedelta(hours=1))
+    # By the watchlist, in the worker that holds its lock
+    SQLiteResponseCacheRepository().set(
+        neighbours_cache_key("testuser", "testrepo"), pinned
+    )
+
+    cache = asyncio.run(get_response_cache())
+
+    assert cache.get(neighbours_cache_key("testuser", "testrepo")) == pinned
+
+
+def test_get_starneighbours_no_longer_pinned(
+    mock_starneighbour_service: AsyncMock,
+    logged_client_http: TestClient,
+    response_cache: InMemoryResponseCacheRepository,
+) -> None:
+    mock_starneighbour_service.iter_neighbours.return_value = []
+    stale = neighbours_response_create([], [], pinned_for=timedelta(hours=1))
+    stale.fetched_at -= timedelta(hours=2)
+    assert stale.pinned_until is not None
+    stale.pinned_until -= timedelta(hours=2)
+    response_cache.set(neighbours_cache_key("testuser", "testrepo"), stale)
+
+    response = logged_client_http.get("/api/v1/repos/testuser/testrepo/starneighbours")
+
+    assert response.status_code == 200
+    # The watchlist stopped refreshing it, so it expired like any response
+    mock_starneighbour_service.iter_neighbours.assert_called_once()
+
+
+def test_watchlist_create(
+    mock_github_repo: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("STARNEIGHBOURS_WATCHLIST", "owner/repo1, owner/repo2,")
+    monkeypatch.setenv("STARNEIGHBOURS_WATCHLIST_INTERVAL", "60")
+
+    watchlist = watchlist_create()
+
+    assert watchlist is not None
+    assert watchlist.targets == [("owner", "repo1"), ("owner", "repo2")]
+    assert watchlist.refresh_interval.total_seconds() == 60
+    # Starred repos cached apart, long enough to resume past the quota
+    first, second = (watchlist.service_create().github_repo for _ in range(2))
+    assert isinstance(first, CachedGitHubRepository)
+    assert isinstance(second, CachedGitHubRepository)
+    assert first.cache.ttl == timedelta(seconds=60)
+    assert first.cache is second.cache
+
+
+def test_watchlist_create_none(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("STARNEIGHBOURS_WATCHLIST", raising=False)
+
+    assert watchlist_create() is None
+
+
+def test_watchlist_create_invalid(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("STARNEIGHBOURS_WATCHLIST", "owner")
+
+    with pytest.raises(ValueError):
+        watchlist_create()
+
+
+def test_lifespan_runs_watchlist(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("STARNEIGHBOURS_WATCHLIST_LOCK", str(tmp_path / "lock"))
+    watchlist = MagicMock()
+    started = asyncio.Event()
+
+    async def run() -> None:
+        started.set()
+        await asyncio.Event().wait()
+
+    watchlist.run = run
+    with (
+        patch("starneighbours.main.watchlist_create", return_value=watchlist),
+        TestClient(app) as client,
+    ):
+        assert client.portal is not None
+        client.portal.call(started.wait)
+
+
+def test_lifespan_watchlist_locked(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("STARNEIGHBOURS_WATCHLIST_LOCK", str(tmp_path / "lock"))
+    watchlist = MagicMock()
+
+    # Another worker runs the watchlist
+    with open(tmp_path / "lock", "ab") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        with (
+            patch("starneighbours.main.watchlist_create", return_value=watchlist),
+            TestClient(app),
+        ):
+            pass
+
+    watchlist.run.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_cancels() -> None:
+    request = MagicMock()
+    request.receive = AsyncMock(
+        side_effect=[
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"},
+        ]
+    )
+    cancelled = asyncio.Event()
+
+    async def crawl() -> None:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnectedError):
+        await cancel_on_disconnect(request, crawl())
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_caller_cancelled() -> None:
+    request = MagicMock()
+    request.receive = AsyncMock(side_effect=asyncio.Event().wait)
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def crawl() -> None:
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    caller = asyncio.create_task(cancel_on_disconnect(request, crawl()))
+    await started.wait()
+    caller.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    assert cancelled.is_set()
+
+
+def test_get_starneighbours_disconnected(
+    mock_starneighbour_service: AsyncMock,
+    logged_client_http: TestClient,
+    response_cache: InMemoryResponseCacheRepository,
+) -> None:
+    async def disconnect(request: object, crawl: Coroutine[None, None, None]) -> None:
+        crawl.close()
+        raise ClientDisconnectedError()
+
+    with patch("starneighbours.repositories.api.cancel_on_disconnect", disconnect):
+        response = logged_client_http.get(
+            "/api/v1/repos/testuser/testrepo/starneighbours"
+        )
+
+    assert response.status_code == 499
+    assert response.content == b""
+    assert response_cache.get(neighbours_cache_key("testuser", "testrepo")) is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_returns() -> None:
+    request = MagicMock()
+    disconnected = asyncio.Event()
+
+    async def receive() -> dict[str, str]:
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    request.receive = receive
+
+    async def crawl() -> str:
+        return "neighbours"
+
+    assert await cancel_on_disconnect(request, crawl()) == "neighbours"
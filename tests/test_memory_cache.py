@@ -0,0 +1,77 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from datetime import datetime, timedelta, timezone
+from starneighbours.models.cache import CachedResponse
+from starneighbours.repositories.memory_cache import InMemoryResponseCacheRepository
+
+
+def _response(content: bytes) -> CachedResponse:
+    return CachedResponse(
+        content=content,
+        etag='"etag"',
+        fetched_at=datetime(2025, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_get_missing() -> None:
+    assert InMemoryResponseCacheRepository().get("missing") is None
+
+
+def test_set_replaces() -> None:
+    cache = InMemoryResponseCacheRepository()
+    cache.set("key", _response(b"old"))
+    cache.set("key", _response(b"new value"))
+
+    response = cache.get("key")
+    assert response is not None
+    assert response.content == b"new value"
+    assert cache.size == len(b"new value")
+
+
+def test_evicts_least_recently_used() -> None:
+    cache = InMemoryResponseCacheRepository(max_size=10)
+    cache.set("a", _response(b"aaaa"))
+    cache.set("b", _response(b"bbbb"))
+    cache.get("a")
+    cache.set("c", _response(b"cccc"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.size == 8
+
+
+def test_too_big_is_not_cached() -> None:
+    cache = InMemoryResponseCacheRepository(max_size=2)
+    cache.set("a", _response(b"aaaa"))
+
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_pinned_is_not_evicted() -> None:
+    cache = InMemoryResponseCacheRepository(max_size=10)
+    pinned = _response(b"pppp")
+    pinned.pinned_until = datetime.now(tz=timezone.utc) + timedelta(hours=1)
+    cache.set("pinned", pinned)
+    cache.set("a", _response(b"aaaa"))
+    cache.set("b", _response(b"bbbb"))
+
+    assert cache.get("pinned") is pinned
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.size == 8
+
+
+def test_no_longer_pinned_is_evicted() -> None:
+    cache = InMemoryResponseCacheRepository(max_size=10)
+    unpinned = _response(b"pppp")
+    unpinned.pinned_until = datetime.now(tz=timezone.utc) - timedelta(hours=1)
+    cache.set("unpinned", unpinned)
+    cache.set("a", _response(b"aaaa"))
+    cache.set("b", _response(b"bbbb"))
+
+    assert cache.get("unpinned") is None
+    assert cache.size == 8
@@ -0,0 +1,50 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from datetime import datetime, timedelta, timezone
+from starneighbours.models.cache import CachedResponse
+from starneighbours.repositories.memory_cache import InMemoryResponseCacheRepository
+from starneighbours.repositories.pinned_cache import PinnedResponseCacheRepository
+
+
+def _response(content: bytes, pinned_for: timedelta | None = None) -> CachedResponse:
+    now = datetime.now(tz=timezone.utc)
+    return CachedResponse(
+        content=content,
+        etag='"etag"',
+        fetched_at=now,
+        pinned_until=None if pinned_for is None else now + pinned_for,
+    )
+
+
+def test_pinned_responses_are_shared() -> None:
+    local = InMemoryResponseCacheRepository()
+    shared = InMemoryResponseCacheRepository()
+    cache = PinnedResponseCacheRepository(local, shared)
+
+    cache.set("pinned", _response(b"pinned", timedelta(hours=1)))
+    cache.set("key", _response(b"local"))
+
+    assert shared.get("pinned") is not None
+    assert local.get("pinned") is None
+    assert shared.get("key") is None
+    assert local.get("key") is not None
+    # E.g. pinned by another worker
+    other = PinnedResponseCacheRepository(InMemoryResponseCacheRepository(), shared)
+    assert other.get("pinned") == shared.get("pinned")
+
+
+def test_expired_pin_falls_back_to_local() -> None:
+    local = InMemoryResponseCacheRepository()
+    shared = InMemoryResponseCacheRepository()
+    shared.set("key", _response(b"expired", -timedelta(hours=1)))
+    cache = PinnedResponseCacheRepository(local, shared)
+
+    assert cache.get("key") is None
+
+    cache.set("key", _response(b"local"))
+
+    response = cache.get("key")
+    assert response is not None
+    assert response.content == b"local"
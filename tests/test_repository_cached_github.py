@@ -0,0 +1,141 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+from typing import Callable
+import pytest
+from starneighbours.models.github import GitHubRepo, GitHubUser
+from starneighbours.repositories.cached_github import (
+    CachedGitHubRepository,
+    StarredReposCache,
+)
+from starneighbours.services.starneighbour import StarNeighbourService
+
+
+@pytest.mark.asyncio
+async def test_cached_github_repository_get_starred_repos(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_starred_repos.return_value = [repo_factory("owner/repo1")]
+    repo = CachedGitHubRepository(mock_github_repo, StarredReposCache())
+
+    assert await repo.get_starred_repos("user1") == [repo_factory("owner/repo1")]
+    assert await repo.get_starred_repos("user1") == [repo_factory("owner/repo1")]
+    assert await repo.get_starred_repos_count("user1") == 1
+
+    mock_github_repo.get_starred_repos.assert_called_once_with("user1")
+    mock_github_repo.get_starred_repos_count.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cached_github_repository_resumes_cancelled_crawl(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    fetched: list[str] = []
+
+    async def get_starred_repos(user: str) -> list[GitHubRepo]:
+        if user == "slow":
+            await asyncio.Event().wait()
+        fetched.append(user)
+        return [repo_factory("owner/repo1")]
+
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="slow"),
+    ]
+    mock_github_repo.get_starred_repos.side_effect = get_starred_repos
+    cache = StarredReposCache()
+
+    service = StarNeighbourService(CachedGitHubRepository(mock_github_repo, cache))
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(service.find_neighbours("owner", "target"), 0.01)
+    assert fetched == ["user1"]
+
+    # The retry only fetches what is missing
+    mock_github_repo.get_starred_repos.side_effect = None
+    mock_github_repo.get_starred_repos.return_value = [repo_factory("owner/repo2")]
+    neighbours = await service.find_neighbours("owner", "target")
+
+    assert {n.repo for n in neighbours} == {"owner/repo1", "owner/repo2"}
+    mock_github_repo.get_starred_repos.assert_called_with("slow")
+    assert mock_github_repo.get_starred_repos.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_cached_github_repository_oldest_fetched_at(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_starred_repos.return_value = [repo_factory("owner/repo1")]
+    cache = StarredReposCache()
+    cache.set("user1", [repo_factory("owner/repo1")])
+    # Fetched by an earlier crawl
+    fetched_at = datetime.now(tz=timezone.utc) - timedelta(minutes=10)
+    cache._starred["user1"] = (fetched_at, *cache._starred["user1"][1:])
+    repo = CachedGitHubRepository(mock_github_repo, cache)
+    assert repo.oldest_fetched_at is None
+
+    await repo.get_starred_repos("user2")
+    assert repo.oldest_fetched_at is not None
+    assert repo.oldest_fetched_at > fetched_at
+
+    await repo.get_starred_repos("user1")
+    assert repo.oldest_fetched_at == fetched_at
+
+
+@pytest.mark.asyncio
+async def test_cached_github_repository_max_age(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_starred_repos.return_value = [repo_factory("owner/repo2")]
+    mock_github_repo.get_starred_repos_count.return_value = 1
+    cache = StarredReposCache()
+    cache.set("user1", [repo_factory("owner/repo1")])
+    repo = CachedGitHubRepository(mock_github_repo, cache, max_age=timedelta(0))
+
+    # Too old for this repository, so fetched again
+    assert await repo.get_starred_repos_count("user1") == 1
+    assert await repo.get_starred_repos("user1") == [repo_factory("owner/repo2")]
+    mock_github_repo.get_starred_repos_count.assert_called_once_with("user1")
+    mock_github_repo.get_starred_repos.assert_called_once_with("user1")
+
+
+def test_starred_repos_cache_evicts_least_recently_used(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    # name, full_name and html_url take 46 bytes
+    repo_size = StarredReposCache.REPO_SIZE + 46
+    cache = StarredReposCache(max_size=3 * repo_size)
+    cache.set("user1", [repo_factory("owner/repo1"), repo_factory("owner/repo2")])
+    cache.set("user2", [repo_factory("owner/repo3")])
+    cache.get("user1")
+    cache.set("user3", [repo_factory("owner/repo4")])
+
+    assert cache.get("user2") is None
+    assert cache.get("user1") is not None
+    assert cache.get("user3") is not None
+    assert cache.size == 3 * repo_size
+
+
+def test_starred_repos_cache_too_big_is_not_cached(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    cache = StarredReposCache(max_size=StarredReposCache.REPO_SIZE)
+    cache.set("user1", [repo_factory("owner/repo1")])
+
+    assert cache.get("user1") is None
+    assert cache.size == 0
+
+
+def test_starred_repos_cache_expires(repo_factory: Callable[..., GitHubRepo]) -> None:
+    cache = StarredReposCache(ttl=timedelta(seconds=-1))
+    cache.set("user1", [repo_factory("owner/repo1")])
+
+    assert cache.get("user1") is None
+    assert cache.size == 0
@@ -2,10 +2,19 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+from datetime import datetime, timezone
+from typing import Any
 from unittest.mock import MagicMock, patch
 import pytest
-from starneighbours.models.github import GitHubAPIError, RateLimitError
+from starneighbours.models.api_token import APIToken
+from starneighbours.models.github import (
+    GitHubAPIError,
+    QuotaExceededError,
+    RateLimitError,
+    UnsupportedQueryError,
+)
 from starneighbours.repositories.github import GitHubAPIRepository
+from starneighbours.repositories.scheduler import FairScheduler
 
 
 @pytest.mark.asyncio
@@ -138,3 +147,218 @@ async def test_github_repository_pagination() -> None:
         # Verify the pagination parameter was used
         assert 1 == mock_client_instance.request.call_args_list[0][1]["params"]["page"]
         assert 2 == mock_client_instance.request.call_args_list[1][1]["params"]["page"]
+
+
+@pytest.mark.asyncio
+async def test_github_repository_get_starred_repos_count() -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.is_success = True
+        mock_response.json.return_value = [{"full_name": "owner/repo1"}]
+        mock_response.links = {
+            "next": {"url": "https://api.github.com/user/1/starred?per_page=1&page=2"},
+            "last": {
+                "url": "https://api.github.com/user/1/starred?per_page=1&page=30000"
+            },
+        }
+
+        mock_client_instance = mock_client.return_value.__aenter__.return_value
+        mock_client_instance.request.return_value = mock_response
+
+        repo = GitHubAPIRepository("test-token")
+        count = await repo.get_starred_repos_count("user")
+
+        assert count == 30000
+        params = mock_client_instance.request.call_args[1]["params"]
+        assert params == {"page": 1, "per_page": 1}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [[], [{"full_name": "owner/repo1"}]])
+async def test_github_repository_get_starred_repos_count_single_page(
+    data: list[dict[str, str]],
+) -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.is_success = True
+        mock_response.json.return_value = data
+        mock_response.links = {}
+
+        mock_client.return_value.__aenter__.return_value.request.return_value = (
+            mock_response
+        )
+
+        repo = GitHubAPIRepository("test-token")
+
+        assert await repo.get_starred_repos_count("user") == len(data)
+
+
+@pytest.mark.asyncio
+async def test_github_repository_get_starred_repos_count_bad_link() -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.is_success = True
+        mock_response.links = {"last": {"url": "https://api.github.com/whatever"}}
+
+        mock_client.return_value.__aenter__.return_value.request.return_value = (
+            mock_response
+        )
+
+        repo = GitHubAPIRepository("test-token")
+
+        with pytest.raises(GitHubAPIError):
+            await repo.get_starred_repos_count("user")
+
+
+@pytest.mark.asyncio
+async def test_github_repository_scheduled() -> None:
+    now = datetime.now(tz=timezone.utc)
+    api_token = APIToken(
+        id=1,
+        name="batch",
+        hashed_token="hash",
+        created_at=now,
+        updated_at=now,
+        hourly_quota=1,
+    )
+    scheduler = FairScheduler()
+
+    with patch("httpx.AsyncClient") as mock_client:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.is_success = True
+        mock_response.json.return_value = [{"login": "user1"}]
+
+        mock_client_instance = mock_client.return_value.__aenter__.return_value
+        mock_client_instance.request.return_value = mock_response
+
+        repo = GitHubAPIRepository(
+            "test-token", scheduler=scheduler, api_token=api_token
+        )
+        await repo.get_stargazers("owner", "repo")
+
+        with pytest.raises(QuotaExceededError):
+            await repo.get_stargazers("owner", "repo")
+
+        assert mock_client_instance.request.call_count == 1
+        assert scheduler.usage(api_token).used == 1
+
+
+def test_github_repository_scheduler_requires_api_token() -> None:
+    with pytest.raises(ValueError):
+        GitHubAPIRepository("test-token", scheduler=FairScheduler())
+
+
+def _stars_page(stars: list[tuple[str, str]], last_page: int | None) -> MagicMock:
+    response = MagicMock()
+    response.status_code = 200
+    response.is_success = True
+    response.json.return_value = [
+        {"starred_at": starred_at, "user": {"login": login}}
+        for login, starred_at in stars
+    ]
+    response.links = (
+        {"last": {"url": f"https://api.github.com/stargazers?page={last_page}"}}
+        if last_page
+        else {}
+    )
+    return response
+
+
+@pytest.mark.asyncio
+async def test_github_repository_get_stargazers_since() -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        pages = {
+            1: _stars_page(
+                [("old1", "2020-01-01T00:00:00Z"), ("old2", "2021-01-01T00:00:00Z")],
+                last_page=3,
+            ),
+            2: _stars_page(
+                [("old3", "2024-12-01T00:00:00Z"), ("user1", "2025-01-02T00:00:00Z")],
+                last_page=3,
+            ),
+            3: _stars_page(
+                [("user2", "2025-01-10T00:00:00Z"), ("user3", "2025-01-20T00:00:00Z")],
+                last_page=3,
+            ),
+        }
+
+        async def request(*args: Any, **kwargs: Any) -> MagicMock:
+            return pages[kwargs["params"]["page"]]
+
+        mock_client_instance = mock_client.return_value.__aenter__.return_value
+        mock_client_instance.request.side_effect = request
+
+        repo = GitHubAPIRepository("test-token")
+        repo.PER_PAGE = 2  # type: ignore[misc]
+        stargazers = await repo.get_stargazers(
+            "owner",
+            "repo",
+            since=datetime(2025, 1, 1, tzinfo=timezone.utc),
+            until=datetime(2025, 1, 15, tzinfo=timezone.utc),
+        )
+
+        assert [s.login for s in stargazers] == ["user1", "user2"]
+        # First page to find the last one, then backward until out of the window
+        requested_pages = [
+            call[1]["params"]["page"]
+            for call in mock_client_instance.request.call_args_list
+        ]
+        assert requested_pages == [1, 3, 2]
+        headers = mock_client_instance.request.call_args[1]["headers"]
+        assert headers["Accept"] == "application/vnd.github.star+json"
+
+
+@pytest.mark.asyncio
+async def test_github_repository_get_stargazers_since_single_page() -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        mock_client_instance = mock_client.return_value.__aenter__.return_value
+        mock_client_instance.request.return_value = _stars_page(
+            [("user1", "2025-01-02T00:00:00Z"), ("user2", "2025-01-10T00:00:00Z")],
+            last_page=None,
+        )
+
+        repo = GitHubAPIRepository("test-token")
+        stargazers = await repo.get_stargazers(
+            "owner", "repo", since=datetime(2025, 1, 1, tzinfo=timezone.utc)
+        )
+
+        assert [s.login for s in stargazers] == ["user1", "user2"]
+        assert mock_client_instance.request.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stargazers_count, capped", [(800, False), (801, True)])
+async def test_github_repository_get_stargazers_since_capped_pages(
+    stargazers_count: int, capped: bool
+) -> None:
+    with patch("httpx.AsyncClient") as mock_client:
+        last_page = GitHubAPIRepository.MAX_STARGAZER_PAGES
+        first_page = _stars_page([("old1", "2020-01-01T00:00:00Z")], last_page)
+        last_stars = _stars_page([("user1", "2025-01-02T00:00:00Z")], last_page)
+        repository = MagicMock()
+        repository.status_code = 200
+        repository.is_success = True
+        repository.json.return_value = {"stargazers_count": stargazers_count}
+
+        async def request(method: str, url: str, **kwargs: Any) -> MagicMock:
+            if url.endswith("/repos/owner/repo"):
+                return repository
+            return last_stars if kwargs["params"]["page"] == last_page else first_page
+
+        mock_client_instance = mock_client.return_value.__aenter__.return_value
+        mock_client_instance.request.side_effect = request
+
+        repo = GitHubAPIRepository("test-token")
+        repo.PER_PAGE = 2  # type: ignore[misc]
+        since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        if capped:
+            # The newest stars aren't listed by GitHub
+            with pytest.raises(UnsupportedQueryError):
+                await repo.get_stargazers("owner", "repo", since=since)
+        else:
+            stargazers = await repo.get_stargazers("owner", "repo", since=since)
+            assert [s.login for s in stargazers] == ["user1"]
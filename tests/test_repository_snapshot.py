@@ -0,0 +1,114 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+import pytest
+from starneighbours.models.github import (
+    GitHubRepo,
+    RepositoryNotFoundError,
+    UnsupportedQueryError,
+)
+from starneighbours.repositories.snapshot import SnapshotGitHubRepository
+from starneighbours.services.starneighbour import StarNeighbourService
+
+
+@pytest.fixture
+def snapshot(
+    tmp_path: Path, repo_factory: Callable[..., GitHubRepo]
+) -> Iterator[SnapshotGitHubRepository]:
+    path = tmp_path / "stars.snapshot"
+    SnapshotGitHubRepository.create(
+        path,
+        {
+            "zoé": [repo_factory("owner/target", 3), repo_factory("other/lib", 10)],
+            "alice": [
+                repo_factory("owner/target", 3),
+                repo_factory("other/lib", 10),
+                repo_factory("big/framework", 100_000),
+            ],
+            "bob": [
+                repo_factory("big/framework", 100_000),
+                repo_factory("owner/target", 3),
+            ],
+            "nobody": [],
+        },
+    )
+    repo = SnapshotGitHubRepository(path)
+    yield repo
+    repo.close()
+
+
+def test_snapshot_sizes(snapshot: SnapshotGitHubRepository) -> None:
+    assert (snapshot.n_users, snapshot.n_repos, snapshot.n_edges) == (4, 3, 7)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_get_stargazers(snapshot: SnapshotGitHubRepository) -> None:
+    stargazers = await snapshot.get_stargazers("owner", "target")
+
+    assert [s.login for s in stargazers] == ["alice", "bob", "zoé"]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_get_stargazers_unknownrepo_factory(
+    snapshot: SnapshotGitHubRepository,
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    with pytest.raises(RepositoryNotFoundError):
+        await snapshot.get_stargazers("owner", "unknown")
+
+
+@pytest.mark.asyncio
+async def test_snapshot_get_stargazers_time_window(
+    snapshot: SnapshotGitHubRepository,
+) -> None:
+    with pytest.raises(UnsupportedQueryError):
+        await snapshot.get_stargazers(
+            "owner", "target", since=datetime(2025, 1, 1, tzinfo=timezone.utc)
+        )
+
+
+@pytest.mark.asyncio
+async def test_snapshot_get_starred_repos(
+    snapshot: SnapshotGitHubRepository, repo_factory: Callable[..., GitHubRepo]
+) -> None:
+    repos = await snapshot.get_starred_repos("alice")
+
+    assert repos == [
+        repo_factory("big/framework", 100_000),
+        repo_factory("other/lib", 10),
+        repo_factory("owner/target", 3),
+    ]
+    assert await snapshot.get_starred_repos("nobody") == []
+    assert await snapshot.get_starred_repos("unknown") == []
+
+
+@pytest.mark.asyncio
+async def test_snapshot_get_starred_repos_count(
+    snapshot: SnapshotGitHubRepository,
+) -> None:
+    assert await snapshot.get_starred_repos_count("alice") == 3
+    assert await snapshot.get_starred_repos_count("zoé") == 2
+    assert await snapshot.get_starred_repos_count("unknown") == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_find_neighbours(snapshot: SnapshotGitHubRepository) -> None:
+    service = StarNeighbourService(snapshot)
+    neighbours = await service.find_neighbours("owner", "target")
+
+    assert {n.repo: [s.login for s in n.stargazers] for n in neighbours} == {
+        "big/framework": ["alice", "bob"],
+        "other/lib": ["alice", "zoé"],
+    }
+
+
+def test_snapshot_invalid_file(tmp_path: Path) -> None:
+    path = tmp_path / "not-a-snapshot"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        SnapshotGitHubRepository(path)
@@ -0,0 +1,176 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from starneighbours.models.api_token import APIToken
+from starneighbours.models.github import QuotaExceededError
+from starneighbours.repositories.scheduler import FairScheduler
+
+
+def _token(
+    id: int,
+    weight: float = 1.0,
+    max_concurrency: int = 4,
+    hourly_quota: int | None = None,
+) -> APIToken:
+    now = datetime.now(tz=timezone.utc)
+    return APIToken(
+        id=id,
+        name=f"token{id}",
+        hashed_token=f"hash{id}",
+        created_at=now,
+        updated_at=now,
+        weight=weight,
+        max_concurrency=max_concurrency,
+        hourly_quota=hourly_quota,
+    )
+
+
+@pytest.mark.asyncio
+async def test_scheduler_weighted_fair_queueing() -> None:
+    scheduler = FairScheduler(max_concurrency=1)
+    batch, interactive = _token(1), _token(2, weight=2)
+    served: list[str] = []
+    gate = asyncio.Event()
+
+    async def request(token: APIToken) -> None:
+        async with scheduler.slot(token):
+            await gate.wait()
+            served.append(token.name)
+
+    # The batch crawl queued first, a lot of requests
+    tasks = [asyncio.create_task(request(batch)) for _ in range(6)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request(interactive)) for _ in range(4)]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+
+    # The interactive client doesn't wait for the end of the batch crawl, and
+    # gets twice as many turns
+    assert served == [
+        "token1",
+        "token2",
+        "token2",
+        "token2",
+        "token1",
+        "token2",
+        "token1",
+        "token1",
+        "token1",
+        "token1",
+    ]
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_token_max_concurrency() -> None:
+    scheduler = FairScheduler(max_concurrency=8)
+    token = _token(1, max_concurrency=2)
+    gate = asyncio.Event()
+
+    async def request() -> None:
+        async with scheduler.slot(token):
+            await gate.wait()
+
+    tasks = [asyncio.create_task(request()) for _ in range(5)]
+    await asyncio.sleep(0)
+
+    usage = scheduler.usage(token)
+    assert (usage.in_flight, usage.queued) == (2, 3)
+
+    gate.set()
+    await asyncio.gather(*tasks)
+    usage = scheduler.usage(token)
+    assert (usage.in_flight, usage.queued, usage.used) == (0, 0, 5)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_quota() -> None:
+    scheduler = FairScheduler()
+    token = _token(1, hourly_quota=2)
+
+    for _ in range(2):
+        async with scheduler.slot(token):
+            pass
+
+    with pytest.raises(QuotaExceededError) as exc_info:
+        async with scheduler.slot(token):
+            pass
+
+    usage = scheduler.usage(token)
+    assert usage.used == 2
+    assert usage.reset_at is not None
+    assert exc_info.value.reset_time == int(usage.reset_at.timestamp())
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancelled_while_queued() -> None:
+    scheduler = FairScheduler(max_concurrency=1)
+    token = _token(1)
+    gate = asyncio.Event()
+
+    async def request() -> None:
+        async with scheduler.slot(token):
+            await gate.wait()
+
+    first = asyncio.create_task(request())
+    second = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    second.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await second
+
+    usage = scheduler.usage(token)
+    assert (usage.queued, usage.used) == (0, 1)
+    gate.set()
+    await first
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancelled_gives_back_quota() -> None:
+    scheduler = FairScheduler(max_concurrency=1)
+    token = _token(1, hourly_quota=2)
+    gate = asyncio.Event()
+
+    async def request() -> None:
+        async with scheduler.slot(token):
+            await gate.wait()
+
+    first = asyncio.create_task(request())
+    second = asyncio.create_task(request())
+    await asyncio.sleep(0)
+    second.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await second
+    gate.set()
+    await first
+
+    # The cancelled request never reached GitHub, so the quota isn't used up
+    await request()
+    assert scheduler.usage(token).used == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_splits_github_quota_by_weight() -> None:
+    scheduler = FairScheduler(github_quota=8)
+    light, heavy = _token(1, weight=1.0), _token(2, weight=3.0)
+
+    # Alone, a token gets all the GitHub quota
+    assert scheduler.usage(light).share == 8
+    async with scheduler.slot(light):
+        pass
+
+    for _ in range(6):
+        async with scheduler.slot(heavy):
+            pass
+    with pytest.raises(QuotaExceededError):
+        async with scheduler.slot(heavy):
+            pass
+
+    assert scheduler.usage(heavy).share == 6
+    assert scheduler.usage(light).share == 2
@@ -0,0 +1,128 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import random
+import tempfile
+from typing import IO, Any, Callable
+from unittest.mock import patch
+import pytest
+from starneighbours.models.github import GitHubRepo, SortKey
+from starneighbours.services.aggregation import (
+    InMemoryAggregator,
+    SpillingAggregator,
+    aggregator_create,
+)
+
+
+def test_aggregator_create() -> None:
+    assert isinstance(aggregator_create(), InMemoryAggregator)
+    assert isinstance(aggregator_create(1024), SpillingAggregator)
+
+
+def _assert_same_as_in_memory(
+    spilling: SpillingAggregator,
+    repo_factory: Callable[..., GitHubRepo],
+    sort: SortKey | None = None,
+) -> None:
+    rnd = random.Random(42)
+    repos = [
+        repo_factory(f"owner{i % 7}/repo{i}", rnd.randint(0, 1000)) for i in range(50)
+    ]
+    in_memory = InMemoryAggregator()
+    for stargazer in range(40):
+        # Duplicates happen when a page shifts during the crawl
+        for repo in rnd.choices(repos, k=rnd.randint(0, 20)):
+            in_memory.add(stargazer, repo)
+            spilling.add(stargazer, repo)
+
+    assert spilling.spilled > 1
+    expected = list(in_memory.groups(40, sort))
+    result = list(spilling.groups(40, sort))
+
+    assert [group.repo for group in result] == [group.repo for group in expected]
+    assert [group.score for group in result] == [group.score for group in expected]
+    assert [group.rows.tolist() for group in result] == [
+        group.rows.tolist() for group in expected
+    ]
+
+
+@pytest.mark.parametrize("sort", [None, *SortKey])
+def test_spilling_aggregator_same_as_in_memory(
+    sort: SortKey | None, repo_factory: Callable[..., GitHubRepo]
+) -> None:
+    _assert_same_as_in_memory(
+        SpillingAggregator(memory_budget=2000), repo_factory, sort
+    )
+
+
+def test_spilling_aggregator_more_runs_than_fan_in(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    spilling = SpillingAggregator(memory_budget=300, max_fan_in=3)
+    opened: list[IO[bytes]] = []
+    temporary_file = tempfile.TemporaryFile
+
+    def track(*args: Any, **kwargs: Any) -> IO[bytes]:
+        file = temporary_file(*args, **kwargs)
+        opened.append(file)
+        return file
+
+    with patch("tempfile.TemporaryFile", track):
+        _assert_same_as_in_memory(spilling, repo_factory)
+
+    # Merged in several passes, and every temporary file is closed at the end
+    assert spilling.spilled > 3**2
+    assert len(opened) > 2
+    assert all(file.closed for file in opened)
+
+
+def test_spilling_aggregator_invalid_fan_in() -> None:
+    with pytest.raises(ValueError):
+        SpillingAggregator(memory_budget=300, max_fan_in=1)
+
+
+def test_spilling_aggregator_without_spill(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    aggregator = SpillingAggregator(memory_budget=1024 * 1024)
+    aggregator.add(0, repo_factory("owner/repo1", 5))
+    aggregator.add(0, repo_factory("owner/repo2", 4))
+    aggregator.add(1, repo_factory("owner/repo2", 3))
+
+    result = list(aggregator.groups(2, SortKey.SHARED))
+
+    assert aggregator.spilled == 0
+    assert [(group.repo, group.score) for group in result] == [
+        ("owner/repo2", 2.0),
+        ("owner/repo1", 1.0),
+    ]
+    assert [group.rows.tolist() for group in result] == [[0, 1], [0]]
+
+
+def test_spilling_aggregator_keeps_stars_seen_first(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    aggregator = SpillingAggregator(memory_budget=1024 * 1024)
+    aggregator.add(0, repo_factory("owner/repo1", 1000))
+    aggregator.add(0, repo_factory("owner/repo2", 2))
+    aggregator.add(1, repo_factory("owner/repo1", 1))
+
+    result = list(aggregator.groups(2, SortKey.JACCARD))
+
+    # 2 / (2 + 1000 - 2) for repo1, 1 / (2 + 2 - 1) for repo2
+    assert [group.repo for group in result] == ["owner/repo2", "owner/repo1"]
+
+
+def test_spilling_aggregator_sorted_keys_spilled(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    # Fewer keys than repos fit in the budget, so the keys are sorted on disk
+    spilling = SpillingAggregator(memory_budget=300)
+    spilling.SCORE_BATCH = 4  # type: ignore[misc]
+
+    _assert_same_as_in_memory(spilling, repo_factory, SortKey.COSINE)
+
+
+def test_spilling_aggregator_empty() -> None:
+    assert list(SpillingAggregator(memory_budget=10).groups(3)) == []
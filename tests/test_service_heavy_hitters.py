@@ -0,0 +1,40 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from collections import Counter
+import random
+import pytest
+from starneighbours.services.heavy_hitters import SpaceSaving
+
+
+def test_space_saving_exact_under_capacity() -> None:
+    sketch = SpaceSaving(capacity=10)
+    for item in ["a", "b", "a", "c", "a", "b"]:
+        sketch.add(item)
+
+    assert sketch.top(2) == [("a", 3, 0), ("b", 2, 0)]
+    assert sketch.total == 6
+
+
+def test_space_saving_error_bounds() -> None:
+    rnd = random.Random(1)
+    stream = [f"repo{int(rnd.paretovariate(1.0))}" for _ in range(20_000)]
+    sketch = SpaceSaving(capacity=50)
+    for item in stream:
+        sketch.add(item)
+
+    counts = Counter(stream)
+    for item, count, error in sketch.top(50):
+        assert count - error <= counts[item] <= count
+    # Heavy hitters are always found
+    top = {item for item, _, _ in sketch.top(50)}
+    assert {item for item, count in counts.items() if count > 20_000 / 50} <= top
+    assert [item for item, _, _ in sketch.top(3)] == [
+        item for item, _ in counts.most_common(3)
+    ]
+
+
+def test_space_saving_invalid_capacity() -> None:
+    with pytest.raises(ValueError):
+        SpaceSaving(capacity=0)
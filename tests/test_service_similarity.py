@@ -0,0 +1,43 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import numpy as np
+import pytest
+from starneighbours.models.github import SortKey
+from starneighbours.services.similarity import (
+    GITHUB_USERS,
+    incidence_matrix_create,
+    similarity_get,
+)
+
+
+def test_incidence_matrix_create_deduplicates_edges() -> None:
+    matrix = incidence_matrix_create([0, 0, 1, 0], [1, 0, 1, 1], (2, 3))
+
+    assert matrix.shape == (2, 3)
+    assert matrix.toarray().tolist() == [[1, 1, 0], [0, 1, 0]]
+    # CSC: the stargazers of a repo are contiguous
+    assert np.diff(matrix.indptr).tolist() == [1, 2, 0]
+
+
+@pytest.mark.parametrize(
+    "metric,expected",
+    [
+        (SortKey.SHARED, [2.0, 1.0]),
+        (SortKey.JACCARD, [2 / (4 + 10 - 2), 1 / (4 + 1 - 1)]),
+        (SortKey.COSINE, [2 / np.sqrt(4 * 10), 1 / np.sqrt(4 * 1)]),
+        (SortKey.LIFT, [2 * GITHUB_USERS / (4 * 10), 1 * GITHUB_USERS / (4 * 1)]),
+    ],
+)
+def test_similarity_get(metric: SortKey, expected: list[float]) -> None:
+    scores = similarity_get(metric, np.array([2, 1]), np.array([10, 1]), 4)
+
+    assert scores.tolist() == pytest.approx(expected)
+
+
+def test_similarity_get_stale_stargazers_count() -> None:
+    # A neighbour can't have fewer stargazers than the ones we've seen
+    scores = similarity_get(SortKey.JACCARD, np.array([3]), np.array([0]), 3)
+
+    assert scores.tolist() == [1.0]
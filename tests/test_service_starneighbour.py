@@ -2,11 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+from datetime import datetime, timezone
 from unittest.mock import AsyncMock
+from typing import Callable
 import pytest
 from starneighbours.models.github import (
+    CrawlPlan,
+    CrawlPolicy,
     GitHubRepo,
     GitHubUser,
+    SortKey,
     StarNeighbour,
     GitHubAPIError,
 )
@@ -49,14 +54,18 @@ async def test_find_neighbours() -> None:
     assert {n.repo for n in neighbours} == {"owner1/repo1", "owner2/repo2"}
 
     # Verify the repository was called correctly
-    mock_github_repo.get_stargazers.assert_called_once_with("owner", "target-repo")
+    mock_github_repo.get_stargazers.assert_called_once_with(
+        "owner", "target-repo", since=None, until=None
+    )
     assert mock_github_repo.get_starred_repos.call_count == 2
     mock_github_repo.get_starred_repos.assert_any_call("user1")
     mock_github_repo.get_starred_repos.assert_any_call("user2")
 
 
 @pytest.mark.asyncio
-async def test_find_neighbours_excludes_target_repo() -> None:
+async def test_find_neighbours_excludes_targetrepo_factory(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
     mock_github_repo = AsyncMock()
     mock_github_repo.get_stargazers.return_value = [
         GitHubUser(login="user1"),
@@ -109,3 +118,253 @@ async def test_find_neighbours_handles_errors() -> None:
     service = StarNeighbourService(mock_github_repo)
     with pytest.raises(GitHubAPIError):
         await service.find_neighbours("owner", "target-repo")
+
+
+@pytest.mark.asyncio
+async def test_find_neighbours_sorted(repo_factory: Callable[..., GitHubRepo]) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+    ]
+    # "big/framework" is starred by everyone, but also by a lot of other people
+    mock_github_repo.get_starred_repos.side_effect = [
+        [repo_factory("big/framework", 100_000), repo_factory("small/lib", 2)],
+        [repo_factory("big/framework", 100_000), repo_factory("other/tool", 50)],
+    ]
+
+    service = StarNeighbourService(mock_github_repo)
+    neighbours = await service.find_neighbours(
+        "owner", "target-repo", sort=SortKey.JACCARD
+    )
+
+    assert [n.repo for n in neighbours] == [
+        "small/lib",
+        "other/tool",
+        "big/framework",
+    ]
+    assert neighbours[0].score == pytest.approx(1 / (2 + 2 - 1))
+    assert [s.login for s in neighbours[2].stargazers] == ["user1", "user2"]
+
+
+@pytest.mark.asyncio
+async def test_find_neighbours_sorted_by_shared(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+    ]
+    mock_github_repo.get_starred_repos.side_effect = [
+        [repo_factory("small/lib", 2), repo_factory("big/framework", 100_000)],
+        [repo_factory("big/framework", 100_000)],
+    ]
+
+    service = StarNeighbourService(mock_github_repo)
+    neighbours = await service.find_neighbours(
+        "owner", "target-repo", sort=SortKey.SHARED
+    )
+
+    assert [(n.repo, n.score) for n in neighbours] == [
+        ("big/framework", 2.0),
+        ("small/lib", 1.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_plan_crawl_without_policy_does_not_probe() -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [GitHubUser(login="user1")]
+
+    service = StarNeighbourService(mock_github_repo)
+    plan = await service.plan_crawl("owner", "target-repo", CrawlPolicy())
+
+    assert plan == CrawlPlan(stargazers=[GitHubUser(login="user1")])
+    mock_github_repo.get_starred_repos_count.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_plan_crawl_skips_heavy_stargazers() -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="collector"),
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+    ]
+    mock_github_repo.get_starred_repos_count.side_effect = [30_000, 12, 7]
+
+    service = StarNeighbourService(mock_github_repo)
+    plan = await service.plan_crawl(
+        "owner", "target-repo", CrawlPolicy(max_starred=1000)
+    )
+
+    assert [s.login for s in plan.stargazers] == ["user1", "user2"]
+    assert [s.login for s in plan.skipped] == ["collector"]
+
+
+@pytest.mark.asyncio
+async def test_plan_crawl_cheapest_first_within_budget() -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+        GitHubUser(login="user3"),
+        GitHubUser(login="user4"),
+    ]
+    mock_github_repo.get_starred_repos_count.side_effect = [50, 10, 40, 20]
+
+    service = StarNeighbourService(mock_github_repo)
+    plan = await service.plan_crawl(
+        "owner", "target-repo", CrawlPolicy(budget=75, cheapest_first=True)
+    )
+
+    assert [s.login for s in plan.stargazers] == ["user2", "user4", "user3"]
+    assert [s.login for s in plan.skipped] == ["user1"]
+
+
+@pytest.mark.asyncio
+async def test_find_neighbours_uses_plan(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_starred_repos.return_value = [repo_factory("owner1/repo1", 10)]
+
+    service = StarNeighbourService(mock_github_repo)
+    neighbours = await service.find_neighbours(
+        "owner",
+        "target-repo",
+        plan=CrawlPlan(
+            stargazers=[GitHubUser(login="user1")],
+            skipped=[GitHubUser(login="collector")],
+        ),
+    )
+
+    assert [n.repo for n in neighbours] == ["owner1/repo1"]
+    mock_github_repo.get_stargazers.assert_not_called()
+    mock_github_repo.get_starred_repos.assert_called_once_with("user1")
+
+
+@pytest.mark.asyncio
+async def test_plan_crawl_time_window() -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [GitHubUser(login="recent")]
+    since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    service = StarNeighbourService(mock_github_repo)
+    plan = await service.plan_crawl("owner", "target-repo", CrawlPolicy(since=since))
+
+    assert plan == CrawlPlan(stargazers=[GitHubUser(login="recent")])
+    mock_github_repo.get_stargazers.assert_called_once_with(
+        "owner", "target-repo", since=since, until=None
+    )
+    mock_github_repo.get_starred_repos_count.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_find_neighbours_memory_budget(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+    ]
+    mock_github_repo.get_starred_repos.side_effect = [
+        [repo_factory("small/lib", 2), repo_factory("big/framework", 100_000)],
+        [repo_factory("big/framework", 100_000), repo_factory("owner/target-repo", 2)],
+    ]
+
+    service = StarNeighbourService(mock_github_repo, memory_budget=1)
+    neighbours = await service.find_neighbours(
+        "owner", "target-repo", sort=SortKey.SHARED
+    )
+
+    assert [(n.repo, n.score) for n in neighbours] == [
+        ("big/framework", 2.0),
+        ("small/lib", 1.0),
+    ]
+    assert [s.login for s in neighbours[0].stargazers] == ["user1", "user2"]
+
+
+@pytest.mark.asyncio
+async def test_find_top_neighbours(repo_factory: Callable[..., GitHubRepo]) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+        GitHubUser(login="user3"),
+    ]
+    mock_github_repo.get_starred_repos.side_effect = [
+        [repo_factory("big/framework", 100_000), repo_factory("small/lib", 2)],
+        [repo_factory("big/framework", 100_000), repo_factory("other/tool", 50)],
+        [repo_factory("big/framework", 100_000), repo_factory("other/tool", 50)],
+    ]
+
+    service = StarNeighbourService(mock_github_repo)
+    neighbours = await service.find_top_neighbours("owner", "target-repo", 2)
+
+    assert neighbours == [
+        StarNeighbour(repo="big/framework", stargazers=[], score=3.0, error=0),
+        StarNeighbour(repo="other/tool", stargazers=[], score=2.0, error=0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_find_top_neighbours_bounded_memory(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    stargazers = [GitHubUser(login=f"user{i}") for i in range(20)]
+    mock_github_repo.get_stargazers.return_value = stargazers
+    # Everyone starred the framework, and many repos nobody else starred
+    mock_github_repo.get_starred_repos.side_effect = [
+        [repo_factory("big/framework", 100_000)]
+        + [repo_factory(f"owner{i}/repo{j}", 1) for j in range(5)]
+        for i in range(20)
+    ]
+
+    service = StarNeighbourService(mock_github_repo)
+    # 10 counters for 120 stars: more than 12 stars is a heavy hitter
+    service.TOP_SKETCH_MIN = 8  # type: ignore[misc]
+    neighbours = await service.find_top_neighbours("owner", "target-repo", 1)
+
+    assert len(neighbours) == 1
+    assert neighbours[0].repo == "big/framework"
+    assert neighbours[0].score is not None and neighbours[0].error is not None
+    assert neighbours[0].score - neighbours[0].error <= 20 <= neighbours[0].score
+
+
+@pytest.mark.asyncio
+async def test_find_top_neighbours_exact(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    mock_github_repo = AsyncMock()
+    mock_github_repo.get_stargazers.return_value = [
+        GitHubUser(login="user1"),
+        GitHubUser(login="user2"),
+    ]
+    starred_repos = {
+        "user1": [repo_factory("big/framework", 100_000), repo_factory("small/lib", 2)],
+        "user2": [
+            repo_factory("other/tool", 50),
+            repo_factory("big/framework", 100_000),
+            repo_factory("big/framework", 100_000),
+        ],
+    }
+    mock_github_repo.get_starred_repos.side_effect = starred_repos.get
+
+    service = StarNeighbourService(mock_github_repo)
+    neighbours = await service.find_top_neighbours(
+        "owner", "target-repo", 1, exact=True
+    )
+
+    assert neighbours == [
+        StarNeighbour(
+            repo="big/framework",
+            stargazers=[GitHubUser(login="user1"), GitHubUser(login="user2")],
+            score=2.0,
+            error=0,
+        )
+    ]
+    assert mock_github_repo.get_starred_repos.call_count == 4
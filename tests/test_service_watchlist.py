@@ -0,0 +1,197 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from unittest.mock import AsyncMock, patch
+import httpx
+import pytest
+from starneighbours.models.cache import neighbours_cache_key
+from starneighbours.models.github import (
+    CrawlPlan,
+    GitHubAPIError,
+    GitHubRepo,
+    GitHubUser,
+    QuotaExceededError,
+    StarNeighbour,
+)
+from starneighbours.repositories.cached_github import (
+    CachedGitHubRepository,
+    StarredReposCache,
+)
+from starneighbours.repositories.memory_cache import InMemoryResponseCacheRepository
+from starneighbours.services.starneighbour import StarNeighbourService
+from starneighbours.services.watchlist import Watchlist
+
+
+def _service() -> AsyncMock:
+    service = AsyncMock()
+    service.github_repo.oldest_fetched_at = None
+    service.plan_crawl.return_value = CrawlPlan(
+        stargazers=[GitHubUser(login="stargazer1")],
+        skipped=[GitHubUser(login="stargazer2")],
+    )
+    service.iter_neighbours.return_value = [
+        StarNeighbour(repo="user1/repo1", stargazers=[GitHubUser(login="stargazer1")])
+    ]
+    return service
+
+
+@pytest.mark.asyncio
+async def test_refresh_pins_neighbours() -> None:
+    service = _service()
+    fetched_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    service.github_repo.oldest_fetched_at = fetched_at
+    cache = InMemoryResponseCacheRepository()
+    watchlist = Watchlist(
+        lambda: service,
+        cache,
+        [("owner", "repo")],
+        refresh_interval=timedelta(hours=1),
+    )
+
+    await watchlist.refresh("owner", "repo")
+
+    response = cache.get(neighbours_cache_key("owner", "repo"))
+    assert response is not None
+    assert response.pinned
+    # As old as the oldest starred repos, but unpinned if the refreshes stop
+    assert response.fetched_at == fetched_at
+    assert response.pinned_until is not None
+    assert (
+        timedelta(hours=2, minutes=59)
+        < response.pinned_until - datetime.now(tz=timezone.utc)
+        <= timedelta(hours=3)
+    )
+    assert json.loads(response.content)[0]["repo"] == "user1/repo1"
+    assert response.headers["X-Skipped-Stargazers"] == "stargazer2"
+    service.iter_neighbours.assert_called_once_with(
+        "owner", "repo", plan=service.plan_crawl.return_value
+    )
+
+
+@pytest.mark.asyncio
+async def test_refresh_resumes_past_the_quota(
+    repo_factory: Callable[..., GitHubRepo],
+) -> None:
+    # 5 starred lists to fetch, and 2 requests per quota window
+    github_repo = AsyncMock()
+    github_repo.get_stargazers.return_value = [
+        GitHubUser(login=f"stargazer{i}") for i in range(5)
+    ]
+    quota = {"left": 2}
+    fetched: list[str] = []
+
+    async def get_starred_repos(user: str) -> list[GitHubRepo]:
+        if not quota["left"]:
+            raise QuotaExceededError(0)
+        quota["left"] -= 1
+        fetched.append(user)
+        return [repo_factory("owner/neighbour")]
+
+    async def wait_for_reset(seconds: float) -> None:
+        quota["left"] = 2
+
+    github_repo.get_starred_repos.side_effect = get_starred_repos
+    starred_repos_cache = StarredReposCache(ttl=Watchlist.REFRESH_INTERVAL)
+    cache = InMemoryResponseCacheRepository()
+    watchlist = Watchlist(
+        lambda: StarNeighbourService(
+            CachedGitHubRepository(github_repo, starred_repos_cache)
+        ),
+        cache,
+        [("owner", "repo")],
+    )
+    sleep = AsyncMock(side_effect=wait_for_reset)
+
+    with patch("starneighbours.services.watchlist.asyncio.sleep", sleep):
+        await watchlist.refresh("owner", "repo")
+
+    # Waited twice, and resumed without fetching anything again
+    assert sleep.call_count == 2
+    assert fetched == [f"stargazer{i}" for i in range(5)]
+    github_repo.get_stargazers.assert_called_once()
+    response = cache.get(neighbours_cache_key("owner", "repo"))
+    assert response is not None
+    assert len(json.loads(response.content)[0]["stargazers"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_run_refreshes_every_interval() -> None:
+    service = _service()
+    watchlist = Watchlist(
+        lambda: service,
+        InMemoryResponseCacheRepository(),
+        [("owner", "repo1"), ("owner", "repo2")],
+        refresh_interval=timedelta(hours=1),
+    )
+    sleep = AsyncMock(side_effect=[None, asyncio.CancelledError])
+
+    with (
+        patch("starneighbours.services.watchlist.asyncio.sleep", sleep),
+        pytest.raises(asyncio.CancelledError),
+    ):
+        await watchlist.run()
+
+    assert service.iter_neighbours.call_count == 4
+    assert 3500 < sleep.call_args_list[0].args[0] <= 3600
+
+
+@pytest.mark.asyncio
+async def test_run_waits_for_the_quota() -> None:
+    service = _service()
+    service.iter_neighbours.side_effect = [
+        QuotaExceededError(0),
+        service.iter_neighbours.return_value,
+    ]
+    cache = InMemoryResponseCacheRepository()
+    watchlist = Watchlist(lambda: service, cache, [("owner", "repo")])
+    sleep = AsyncMock(side_effect=[None, asyncio.CancelledError])
+
+    with (
+        patch("starneighbours.services.watchlist.asyncio.sleep", sleep),
+        pytest.raises(asyncio.CancelledError),
+    ):
+        await watchlist.run()
+
+    # Waited for the reset, then retried the same target
+    assert sleep.call_args_list[0].args[0] == 0
+    assert service.iter_neighbours.call_count == 2
+    assert cache.get(neighbours_cache_key("owner", "repo")) is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error",
+    [
+        GitHubAPIError("Not Found"),
+        httpx.ConnectError("Connection refused"),
+        # Resets after the next refresh should have started
+        QuotaExceededError(2**40),
+    ],
+)
+async def test_run_skips_failing_target(error: Exception) -> None:
+    service = _service()
+    service.iter_neighbours.side_effect = [
+        error,
+        service.iter_neighbours.return_value,
+    ]
+    cache = InMemoryResponseCacheRepository()
+    watchlist = Watchlist(
+        lambda: service, cache, [("owner", "gone"), ("owner", "repo")]
+    )
+
+    with (
+        patch(
+            "starneighbours.services.watchlist.asyncio.sleep",
+            AsyncMock(side_effect=asyncio.CancelledError),
+        ),
+        pytest.raises(asyncio.CancelledError),
+    ):
+        await watchlist.run()
+
+    assert cache.get(neighbours_cache_key("owner", "gone")) is None
+    assert cache.get(neighbours_cache_key("owner", "repo")) is not None
@@ -3,7 +3,9 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
 from datetime import datetime
+from pathlib import Path
 import sqlite3
+import pytest
 from starneighbours.models.api_token import APIToken
 from starneighbours.repositories.sqlite_api_token import SQLiteAPITokenRepository
 
@@ -47,3 +49,89 @@ def test_get_by_token_returns_none_for_wrong_token(
     """Test that get_by_token returns None for a wrong token."""
 
     assert repo_token.get_by_token("wrong-token") is None
+
+
+def test_create_with_cache_max_age(repo_token: SQLiteAPITokenRepository) -> None:
+    """Test that the freshness of responses is stored with the token."""
+
+    repo_token.create("dashboard", "dashboard-token", cache_max_age=3600)
+
+    result = repo_token.get_by_token("dashboard-token")
+    assert result is not None
+    assert result.cache_max_age == 3600
+
+
+def test_init_adds_cache_max_age_to_old_databases(db_path: Path) -> None:
+    """Test that databases created without cache_max_age are migrated."""
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE api_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                hashed_token TEXT NOT NULL UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                comments TEXT
+            )
+        """)
+        conn.execute(
+            """
+            INSERT INTO api_tokens (name, hashed_token, created_at, updated_at, comments)
+            VALUES ('old', 'hash', '2025-01-01T00:00:00', '2025-01-01T00:00:00', '')
+            """
+        )
+
+    SQLiteAPITokenRepository.DB_PATH = db_path
+    repo = SQLiteAPITokenRepository()
+    repo.create("new", "new-token")
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT name, cache_max_age FROM api_tokens ORDER BY id"
+        ).fetchall()
+    assert rows == [("old", 300), ("new", 300)]
+
+
+def test_create_with_quota_share(
+    repo_token: SQLiteAPITokenRepository, test_token_name: str
+) -> None:
+    """Test that the share of the GitHub quota is stored with the token."""
+
+    repo_token.create(
+        "batch", "batch-token", weight=0.5, max_concurrency=1, hourly_quota=1000
+    )
+
+    result = repo_token.get_by_token("batch-token")
+    assert result is not None
+    assert (result.weight, result.max_concurrency, result.hourly_quota) == (
+        0.5,
+        1,
+        1000,
+    )
+
+    result = repo_token.get_by_token(test_token_name)
+    assert result is not None
+    assert (result.weight, result.max_concurrency, result.hourly_quota) == (
+        1.0,
+        4,
+        None,
+    )
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"weight": 0},
+        {"max_concurrency": 0},
+        {"cache_max_age": -1},
+        {"hourly_quota": -1},
+    ],
+)
+def test_create_rejects_invalid_settings(
+    repo_token: SQLiteAPITokenRepository, settings: dict[str, float]
+) -> None:
+    with pytest.raises(ValueError):
+        repo_token.create("invalid", "invalid-token", **settings)  # type: ignore[arg-type]
+
+    assert repo_token.get_by_token("invalid-token") is None
@@ -0,0 +1,54 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from starneighbours.models.cache import CachedResponse
+from starneighbours.repositories.sqlite_response_cache import (
+    SQLiteResponseCacheRepository,
+)
+
+
+def _response(content: bytes, pinned_for: timedelta) -> CachedResponse:
+    now = datetime.now(tz=timezone.utc)
+    return CachedResponse(
+        content=content,
+        etag='"etag"',
+        fetched_at=now,
+        headers={"X-Skipped-Stargazers-Count": "1"},
+        pinned_until=now + pinned_for,
+    )
+
+
+def test_get_missing(tmp_path: Path) -> None:
+    assert SQLiteResponseCacheRepository(tmp_path / "db").get("missing") is None
+
+
+def test_shared_between_workers(tmp_path: Path) -> None:
+    response = _response(b"pinned", timedelta(hours=1))
+    SQLiteResponseCacheRepository(tmp_path / "db").set("key", response)
+
+    # E.g. in another worker process
+    assert SQLiteResponseCacheRepository(tmp_path / "db").get("key") == response
+
+
+def test_set_replaces(tmp_path: Path) -> None:
+    cache = SQLiteResponseCacheRepository(tmp_path / "db")
+    cache.set("key", _response(b"old", timedelta(hours=1)))
+    cache.set("key", _response(b"new", timedelta(hours=1)))
+
+    response = cache.get("key")
+    assert response is not None
+    assert response.content == b"new"
+
+
+def test_set_removes_expired_pins(tmp_path: Path) -> None:
+    cache = SQLiteResponseCacheRepository(tmp_path / "db")
+    cache.set("expired", _response(b"old", -timedelta(hours=1)))
+    assert cache.get("expired") is not None
+
+    cache.set("key", _response(b"new", timedelta(hours=1)))
+
+    assert cache.get("expired") is None
+    assert cache.get("key") is not None